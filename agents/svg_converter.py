@@ -0,0 +1,296 @@
+"""
+将包含单个 SVG 的 HTML（或 SVG 文件）转为 PNG / PDF。
+
+纯静态的 SVG（没有脚本、样式表或 foreignObject）用 cairosvg 直接栅格化，
+不启动浏览器；其余情况交给 vis2mobile_py 的 Playwright 渲染池处理。
+
+cairosvg 是项目依赖（`uv sync` 即安装），但它需要系统的 cairo 库
+（macOS: `brew install cairo`，Debian/Ubuntu: `apt install libcairo2`）。
+缺少 cairo 时所有转换都退回到 Chromium。
+"""
+
+import asyncio
+import re
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Literal
+
+# 作为脚本运行时（python agents/html_to_image.py），仓库根目录不在 sys.path 中。
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import cairosvg
+except (ImportError, OSError):
+    # OSError：已安装 cairosvg，但找不到 cairo 动态库。
+    cairosvg = None
+
+OutputFormat = Literal["png", "pdf"]
+Backend = Literal["cairosvg", "chromium"]
+
+# 出现这些标签时，SVG 的外观依赖于浏览器（脚本、样式表、嵌入的 HTML）。
+_DYNAMIC_TAGS = {"script", "style", "link", "foreignobject", "iframe", "canvas"}
+# 可以出现在 SVG 外面而不影响显示的标签。
+_CONTAINER_TAGS = {"html", "head", "body", "meta", "title", "div"}
+
+SVG_NAMESPACE = "http://www.w3.org/2000/svg"
+XLINK_NAMESPACE = "http://www.w3.org/1999/xlink"
+
+
+@dataclass
+class ConversionParams:
+    html_path: Path
+    output_path: Path
+
+
+class _SvgExtractor(HTMLParser):
+    """记录唯一的顶层 <svg> 在源码中的位置，以及是否出现依赖浏览器的内容。"""
+
+    def __init__(self, source: str):
+        super().__init__(convert_charrefs=True)
+        self.source = source
+        # getpos() 返回 (行, 列)，这里换算成源码中的偏移量。
+        self._line_offsets = [0]
+        for line in source.split("\n"):
+            self._line_offsets.append(self._line_offsets[-1] + len(line) + 1)
+        self.svg_spans: list[tuple[int, int]] = []
+        self.dynamic = False
+        self._svg_depth = 0
+        self._svg_start = 0
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        self._check(tag, attrs)
+        if tag == "svg":
+            if self._svg_depth == 0:
+                self._svg_start = self._offset()
+            self._svg_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._check(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "svg" and self._svg_depth > 0:
+            self._svg_depth -= 1
+            if self._svg_depth == 0:
+                end = self.source.index(">", self._offset()) + 1
+                self.svg_spans.append((self._svg_start, end))
+
+    def handle_data(self, data):
+        # SVG 外面的可见文字同样需要浏览器排版。
+        if self._svg_depth == 0 and data.strip() and self.lasttag != "title":
+            self.dynamic = True
+
+    def _check(self, tag, attrs):
+        if tag in _DYNAMIC_TAGS:
+            self.dynamic = True
+        elif self._svg_depth == 0 and tag not in _CONTAINER_TAGS and tag != "svg":
+            self.dynamic = True
+        if any(name.startswith("on") for name, _ in attrs):
+            self.dynamic = True
+
+
+def extract_static_svg(source: str) -> str | None:
+    """
+    如果 `source`（HTML 或 SVG 源码）只包含一个不依赖 CSS / JS 的 SVG，返回该 SVG 的
+    源码，否则返回 None。
+    """
+    extractor = _SvgExtractor(source)
+    extractor.feed(source)
+    extractor.close()
+    if extractor.dynamic or len(extractor.svg_spans) != 1:
+        return None
+    start, end = extractor.svg_spans[0]
+    svg = source[start:end]
+    # 内嵌在 HTML 里的 SVG 通常省略命名空间，XML 解析需要补上。
+    opening = svg[: svg.index(">")]
+    if not re.search(r"\sxmlns\s*=", opening):
+        svg = svg.replace("<svg", f'<svg xmlns="{SVG_NAMESPACE}"', 1)
+    if "xlink:" in svg and not re.search(r"\sxmlns:xlink\s*=", opening):
+        svg = svg.replace("<svg", f'<svg xmlns:xlink="{XLINK_NAMESPACE}"', 1)
+    return svg
+
+
+def _convert_with_cairosvg(svg: str, output_path: Path, format: OutputFormat) -> bool:
+    """用 cairosvg 直接转换；SVG 不是合法 XML 等无法处理的情况返回 False。"""
+    convert = cairosvg.svg2png if format == "png" else cairosvg.svg2pdf
+    try:
+        convert(bytestring=svg.encode("utf-8"), write_to=str(output_path))
+    except Exception:
+        return False
+    return True
+
+
+_SVG_BOX = """
+() => {
+  const svg = document.querySelector("svg");
+  const rect = (svg || document.documentElement).getBoundingClientRect();
+  return {
+    width: Math.ceil(rect.right + window.scrollX),
+    height: Math.ceil(rect.bottom + window.scrollY),
+  };
+}
+"""
+
+
+async def _convert_with_chromium(
+    html_path: Path, output_path: Path, format: OutputFormat
+) -> None:
+    from vis2mobile_py.render.options import RenderOptions
+    from vis2mobile_py.render.pool import get_render_pool
+    from vis2mobile_py.render.readiness import ReadinessEngine
+    from vis2mobile_py.render.routes import get_asset_router, virtual_url
+    from vis2mobile_py.utils import VIEWPORTS, html_to_image
+
+    if format == "png":
+        # 截取 <svg> 元素本身；找不到时退回到页面内容的包围盒。
+        await html_to_image(
+            html_path,
+            "desktop",
+            return_type="path",
+            save_to=output_path,
+            options=RenderOptions(capture="element", selector="svg"),
+        )
+        return
+
+    pool = await get_render_pool()
+    readiness = ReadinessEngine()
+    router = get_asset_router()
+    async with pool.page(VIEWPORTS["desktop"], readiness.init_scripts) as page:
+        route_log = await router.install(page, html_path)
+        try:
+            await page.goto(virtual_url(html_path))
+            await readiness.wait(page)
+            box = await page.evaluate(_SVG_BOX)
+            # 页面尺寸与 SVG 一致，整张图落在同一页上。
+            await page.pdf(
+                path=output_path,
+                width=f"{max(box['width'], 1)}px",
+                height=f"{max(box['height'], 1)}px",
+                print_background=True,
+                page_ranges="1",
+            )
+        finally:
+            await router.uninstall(page, route_log)
+
+
+async def convert(params: ConversionParams, format: OutputFormat) -> Backend:
+    """转换单个文件，返回实际使用的后端。"""
+    html_path = Path(params.html_path)
+    output_path = Path(params.output_path)
+    assert html_path.exists(), f"文件不存在：{html_path}"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if cairosvg is not None:
+        svg = extract_static_svg(html_path.read_text(encoding="utf-8"))
+        if svg is not None and await asyncio.to_thread(
+            _convert_with_cairosvg, svg, output_path, format
+        ):
+            return "cairosvg"
+    await _convert_with_chromium(html_path, output_path, format)
+    return "chromium"
+
+
+async def _convert_all(
+    items: list[ConversionParams], format: OutputFormat, concurrency: int
+) -> list[Backend | Exception]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(params: ConversionParams) -> Backend | Exception:
+        async with semaphore:
+            try:
+                return await convert(params, format)
+            except Exception as e:
+                return e
+
+    try:
+        return await asyncio.gather(*(run(params) for params in items))
+    finally:
+        # 渲染池绑定在当前事件循环上，必须在 asyncio.run 结束前关闭。
+        from vis2mobile_py.render.pool import close_render_pool
+
+        await close_render_pool()
+
+
+def _convert_one(params: ConversionParams, format: OutputFormat) -> Backend:
+    (result,) = asyncio.run(_convert_all([params], format, concurrency=1))
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def to_png(params: ConversionParams) -> Backend:
+    """将 `params.html_path` 转为 PNG，写入 `params.output_path`。"""
+    return _convert_one(params, "png")
+
+
+def to_pdf(params: ConversionParams) -> Backend:
+    """将 `params.html_path` 转为 PDF，写入 `params.output_path`。"""
+    return _convert_one(params, "pdf")
+
+
+def convert_directory(
+    input_dir: Path,
+    output_dir: Path,
+    format: OutputFormat = "png",
+    concurrency: int = 4,
+) -> dict[Path, Backend | Exception]:
+    """
+    批量转换 `input_dir` 下所有 .html / .svg 文件，输出到 `output_dir` 中同名的
+    .png / .pdf。所有需要浏览器的文件共用一个渲染池；单个文件失败不影响其他文件。
+    """
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    sources = sorted(
+        p for p in input_dir.iterdir() if p.suffix.lower() in (".html", ".svg")
+    )
+    items = [
+        ConversionParams(
+            html_path=source, output_path=output_dir / f"{source.stem}.{format}"
+        )
+        for source in sources
+    ]
+    results = asyncio.run(_convert_all(items, format, concurrency))
+    return dict(zip(sources, results))
+
+
+def main() -> None:
+    parser = ArgumentParser(
+        description="批量将目录中的 HTML（仅 SVG）/ SVG 文件转为 PNG 或 PDF。"
+    )
+    parser.add_argument("input_dir", type=Path, help="包含 .html / .svg 文件的目录。")
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        default=Path("output"),
+        help="输出目录（默认 output）。",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["png", "pdf"],
+        default="png",
+        help="输出格式（默认 png）。",
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=4, help="同时转换的文件数（默认 4）。"
+    )
+    args = parser.parse_args()
+    results = convert_directory(
+        args.input_dir, args.output_dir, args.format, args.concurrency
+    )
+    for source, result in results.items():
+        if isinstance(result, Exception):
+            print(f"✗ {source.name}：{result}")
+        else:
+            print(f"✓ {source.name}（{result}）")
+
+
+if __name__ == "__main__":
+    main()
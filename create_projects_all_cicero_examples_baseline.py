@@ -13,7 +13,9 @@ from pathlib import Path
 import shutil
 import pathspec
 
-from vis2mobile_py.utils import html_to_image
+from vis2mobile_py.utils import html_to_images
+from vis2mobile_py.render.log import save_render_log
+from vis2mobile_py.render.pool import close_render_pool
 
 
 CICERO_PROJECTS = [
@@ -85,15 +87,29 @@ async def prepare_project_baseline(
     original_folder = project_dir / "original_visualization"
     original_folder.mkdir(parents=True, exist_ok=True)
 
-    original_image_desktop = await html_to_image(original_visualization, "desktop")
-    original_image_mobile = await html_to_image(original_visualization, "mobile")
-    original_image_desktop.save(original_folder / "desktop.png")
-    original_image_mobile.save(original_folder / "desktop_on_mobile.png")
+    renders = await html_to_images(
+        original_visualization,
+        ratios=["desktop", "mobile"],
+        return_type="result",
+        save_to={
+            "desktop": original_folder / "desktop.png",
+            "mobile": original_folder / "desktop_on_mobile.png",
+        },
+    )
+    render_log_path = original_folder / "render-log.json"
+    render_errors = save_render_log(
+        {ratio: result.log for ratio, result in renders.items()}, render_log_path
+    )
     shutil.copy2(
         original_visualization,
         original_folder / f"desktop{original_visualization.suffix}",
     )
     print(f"Saved {original_visualization} and its rendered images to {original_folder}")
+    if render_errors:
+        print(
+            f"Warning: rendering {original_visualization} reported errors "
+            f"(see {render_log_path}):\n{render_errors}"
+        )
 
     if vega_asset_path and vega_asset_path.exists():
         assets_dest = project_dir / "assets"
@@ -124,8 +140,10 @@ async def create_projects_with_concurrency(
                 return (project_dir.name, False, str(exc))
 
     tasks = [run_with_semaphore(src, dst) for src, dst in projects]
-    results = await asyncio.gather(*tasks)
-    return results
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        await close_render_pool()
 
 
 def main() -> None:
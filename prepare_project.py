@@ -2,11 +2,18 @@ from dotenv import load_dotenv
 import os
 import asyncio
 import argparse
+import json
+from vis2mobile_py.prompts.estimate import PromptBudget
 from vis2mobile_py.prompts.planner import get_prompt
 from google.genai import types
-from google import genai
 from pathlib import Path
-from vis2mobile_py.utils import html_to_image
+from vis2mobile_py.utils import html_to_images
+from vis2mobile_py.render.log import save_render_log
+from vis2mobile_py.llm.client import close_planner_client, get_planner_client
+from vis2mobile_py.llm.context_cache import get_context_cache
+from vis2mobile_py.llm.plan_cache import generate_plan
+from vis2mobile_py.render.pool import close_render_pool
+from vis2mobile_py.render.vega import save_vega_data
 import shutil
 import pathspec
 
@@ -67,30 +74,55 @@ if os.getenv("GEMINI_KEY") is None:
 
 
 async def get_plan(
-    original_visualization: Path, action_space_document: Path, use_flash: bool
+    original_visualization: Path,
+    action_space_document: Path,
+    use_flash: bool,
+    refresh_plan: bool = False,
+    budget: PromptBudget | None = None,
 ):
-    prompt = await get_prompt(
+    model = "gemini-3-flash-preview" if use_flash else "gemini-3-pro-preview"
+    media_resolution = "MEDIA_RESOLUTION_HIGH"
+    prompt, metadata = await get_prompt(
         source_path=original_visualization,
         vis2mobile_design_action_space_path=action_space_document,
         ai_service="gemini",
+        with_metadata=True,
+        budget=budget,
+        media_resolution=media_resolution,
     )
-    client = genai.Client(
-        api_key=os.getenv("GEMINI_KEY"),
-    ).aio
+    estimate = {
+        "source": str(original_visualization),
+        "model": model,
+        **metadata["estimate"],
+    }
+    print(
+        f"Planner prompt: ~{estimate['total_tokens']:,} tokens, "
+        f"{estimate['request_bytes'] / 1e6:.1f} MB"
+    )
+    client = get_planner_client()
 
     generate_content_config = types.GenerateContentConfig(
         thinking_config=types.ThinkingConfig(
             thinking_level="HIGH",
         ),
-        media_resolution="MEDIA_RESOLUTION_HIGH",
+        media_resolution=media_resolution,
     )
-    response = await client.models.generate_content(
-        model="gemini-3-flash-preview" if use_flash else "gemini-3-pro-preview",
-        contents=prompt,
-        config=generate_content_config,
+    plan = await generate_plan(
+        client,
+        model,
+        prompt,
+        generate_content_config,
+        refresh=refresh_plan,
+        context_cache=get_context_cache(client),
+        static_prefix_parts=metadata["static_prefix"]["parts"],
     )
-    plan = response.parts[0].text
-    return plan
+    if plan.cache_hit:
+        print(
+            f"Reusing the cached plan {plan.key[:12]}, pass --refresh-plan to regenerate it"
+        )
+    elif plan.context_cache:
+        print(f"Served the static prompt prefix from {plan.context_cache}")
+    return plan.text, estimate
 
 
 async def main(
@@ -99,6 +131,10 @@ async def main(
     project_template: Path,
     action_space_document: Path,
     use_flash: bool,
+    allow_render_errors: bool = False,
+    refresh_plan: bool = False,
+    max_prompt_tokens: int | None = None,
+    max_request_mb: float | None = None,
 ):
     assert original_visualization.exists(), (
         f"Original visualization {original_visualization} does not exist"
@@ -115,30 +151,76 @@ async def main(
     assert len(mobile_project_name) > 0, (
         f"Mobile project name {mobile_project_name} is empty"
     )
-    project = Path(mobile_project_name)
-    copy_project_template(project_template, project)
+    try:
+        project = Path(mobile_project_name)
+        copy_project_template(project_template, project)
 
-    original_folder = project / "original_visualization"
-    # Ensure original_folder exists (it might not be in the template)
-    original_folder.mkdir(parents=True, exist_ok=True)
+        original_folder = project / "original_visualization"
+        # Ensure original_folder exists (it might not be in the template)
+        original_folder.mkdir(parents=True, exist_ok=True)
 
-    original_image_desktop = await html_to_image(original_visualization, "desktop")
-    original_image_mobile = await html_to_image(original_visualization, "mobile")
-    original_image_desktop.save(original_folder / "desktop.png")
-    original_image_mobile.save(original_folder / "desktop_on_mobile.png")
-    shutil.copy2(
-        original_visualization,
-        original_folder / f"desktop{original_visualization.suffix}",
-    )
-    print(
-        f"Saved {original_visualization} and its rendered images to {original_folder}"
-    )
-    shutil.copy2(action_space_document, project)
-    print(f"Saved {action_space_document} to {project}")
-    plan = await get_plan(original_visualization, action_space_document, use_flash)
-    with open(project / "transform-plan.md", "w") as f:
-        f.write(plan)
-    print(f"Saved transform plan to {project / 'transform-plan.md'}")
+        renders = await html_to_images(
+            original_visualization,
+            ratios=["desktop", "mobile"],
+            return_type="result",
+            save_to={
+                "desktop": original_folder / "desktop.png",
+                "mobile": original_folder / "desktop_on_mobile.png",
+            },
+            vega_data=True,
+        )
+        render_log_path = original_folder / "render-log.json"
+        render_errors = save_render_log(
+            {ratio: result.log for ratio, result in renders.items()}, render_log_path
+        )
+        if renders["desktop"].vega_data:
+            # Transformed datasets and mark bounds, so agents need not re-derive them.
+            save_vega_data(renders["desktop"].vega_data, original_folder / "vega-data")
+            print(
+                f"Saved Vega state, datasets and scenegraph to {original_folder / 'vega-data'}"
+            )
+        shutil.copy2(
+            original_visualization,
+            original_folder / f"desktop{original_visualization.suffix}",
+        )
+        print(
+            f"Saved {original_visualization} and its rendered images to {original_folder}"
+        )
+        if render_errors:
+            message = (
+                f"Rendering {original_visualization} reported errors "
+                f"(see {render_log_path}):\n{render_errors}"
+            )
+            if not allow_render_errors:
+                raise RuntimeError(
+                    message + "\nPass --allow-render-errors to generate a plan anyway."
+                )
+            print(f"Warning: {message}")
+        shutil.copy2(action_space_document, project)
+        print(f"Saved {action_space_document} to {project}")
+        budget = None
+        if max_prompt_tokens is not None or max_request_mb is not None:
+            budget = PromptBudget(
+                max_tokens=max_prompt_tokens,
+                max_request_bytes=(
+                    int(max_request_mb * 1e6) if max_request_mb is not None else None
+                ),
+            )
+        plan, estimate = await get_plan(
+            original_visualization,
+            action_space_document,
+            use_flash,
+            refresh_plan,
+            budget,
+        )
+        with open(project / "prompt-estimate.json", "w") as f:
+            json.dump(estimate, f, indent=2)
+        with open(project / "transform-plan.md", "w") as f:
+            f.write(plan)
+        print(f"Saved transform plan to {project / 'transform-plan.md'}")
+    finally:
+        await close_render_pool()
+        await close_planner_client()
     print("Done")
 
 
@@ -180,6 +262,28 @@ It will do the following:
         action="store_true",
         help="Use Gemini 3 Flash if you only have a free-tier API key",
     )
+    parser.add_argument(
+        "--allow-render-errors",
+        action="store_true",
+        help="Generate a plan even if rendering the original visualization reported errors",
+    )
+    parser.add_argument(
+        "--refresh-plan",
+        action="store_true",
+        help="Regenerate the transform plan even if an identical request was cached",
+    )
+    parser.add_argument(
+        "--max-prompt-tokens",
+        type=int,
+        default=None,
+        help="Reduce the planner prompt (source, then images) to this many estimated tokens, or fail",
+    )
+    parser.add_argument(
+        "--max-request-mb",
+        type=float,
+        default=None,
+        help="Scale down the planner prompt's images until the request is at most this many MB, or fail",
+    )
     args = parser.parse_args()
 
     asyncio.run(
@@ -189,5 +293,9 @@ It will do the following:
             args.project_template,
             args.action_space_document,
             args.use_flash,
+            args.allow_render_errors,
+            args.refresh_plan,
+            args.max_prompt_tokens,
+            args.max_request_mb,
         )
     )
@@ -1,7 +1,10 @@
 import asyncio
 import argparse
 from pathlib import Path
-from vis2mobile_py.utils import html_to_image
+from vis2mobile_py.utils import html_to_images
+from vis2mobile_py.render.log import save_render_log
+from vis2mobile_py.render.pool import close_render_pool
+from vis2mobile_py.render.vega import save_vega_data
 import shutil
 import pathspec
 
@@ -73,29 +76,53 @@ async def main(
     assert len(mobile_project_name) > 0, (
         f"Mobile project name {mobile_project_name} is empty"
     )
-    project = Path(mobile_project_name)
-    copy_project_template(project_template, project)
-
-    original_folder = project / "original_visualization"
-    # Ensure original_folder exists (it might not be in the template)
-    original_folder.mkdir(parents=True, exist_ok=True)
-
-    original_image_desktop = await html_to_image(original_visualization, "desktop")
-    original_image_mobile = await html_to_image(original_visualization, "mobile")
-    original_image_desktop.save(original_folder / "desktop.png")
-    original_image_mobile.save(original_folder / "desktop_on_mobile.png")
-    shutil.copy2(
-        original_visualization,
-        original_folder / f"desktop{original_visualization.suffix}",
-    )
-    print(
-        f"Saved {original_visualization} and its rendered images to {original_folder}"
-    )
-    # Copy vega assets
-    if vega_asset_path and vega_asset_path.exists():
-        assets_dest = project / "assets"
-        shutil.copytree(vega_asset_path, assets_dest, dirs_exist_ok=True)
-        print(f"Copied vega assets from {vega_asset_path} to {assets_dest}")
+    try:
+        project = Path(mobile_project_name)
+        copy_project_template(project_template, project)
+
+        original_folder = project / "original_visualization"
+        # Ensure original_folder exists (it might not be in the template)
+        original_folder.mkdir(parents=True, exist_ok=True)
+
+        renders = await html_to_images(
+            original_visualization,
+            ratios=["desktop", "mobile"],
+            return_type="result",
+            save_to={
+                "desktop": original_folder / "desktop.png",
+                "mobile": original_folder / "desktop_on_mobile.png",
+            },
+            vega_data=True,
+        )
+        render_log_path = original_folder / "render-log.json"
+        render_errors = save_render_log(
+            {ratio: result.log for ratio, result in renders.items()}, render_log_path
+        )
+        if renders["desktop"].vega_data:
+            # Transformed datasets and mark bounds, so agents need not re-derive them.
+            save_vega_data(renders["desktop"].vega_data, original_folder / "vega-data")
+            print(
+                f"Saved Vega state, datasets and scenegraph to {original_folder / 'vega-data'}"
+            )
+        shutil.copy2(
+            original_visualization,
+            original_folder / f"desktop{original_visualization.suffix}",
+        )
+        print(
+            f"Saved {original_visualization} and its rendered images to {original_folder}"
+        )
+        if render_errors:
+            print(
+                f"Warning: rendering {original_visualization} reported errors "
+                f"(see {render_log_path}):\n{render_errors}"
+            )
+        # Copy vega assets
+        if vega_asset_path and vega_asset_path.exists():
+            assets_dest = project / "assets"
+            shutil.copytree(vega_asset_path, assets_dest, dirs_exist_ok=True)
+            print(f"Copied vega assets from {vega_asset_path} to {assets_dest}")
+    finally:
+        await close_render_pool()
     print("Done")
 
 
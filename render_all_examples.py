@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Render every example in ./vega-examples and ./cicero-examples in a single process.
+All renders share one browser and populate the render cache, together with
+the Vega data the prepare scripts export, so subsequent prepare_project*.py
+runs on these examples do not launch Chromium.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from vis2mobile_py.render.events import JsonlSink, add_render_hook
+from vis2mobile_py.render.options import RenderOptions
+from vis2mobile_py.render.pool import RenderPool
+from vis2mobile_py.utils import RenderJob, render_many
+
+EXAMPLE_GLOBS = [
+    "vega-examples/vega/*.html",
+    "vega-examples/vega_altair/*.html",
+    "vega-examples/vega_lite/*.html",
+    "cicero-examples/*-processed.html",
+]
+
+DEFAULT_CONCURRENCY = 8
+
+
+async def render_all(
+    jobs: list[RenderJob],
+    concurrency: int,
+    output_dir: Path | None,
+    options: RenderOptions,
+    pool: RenderPool,
+) -> list[tuple[str, bool, str]]:
+    base_dir = Path(__file__).parent.resolve()
+    results = []
+    try:
+        async for outcome in render_many(
+            jobs, concurrency=concurrency, pool=pool, on_blank="flag", options=options
+        ):
+            name = str(Path(outcome.job.path).relative_to(base_dir))
+            if outcome.error is not None:
+                print(f"✗ Failed: {name} - {outcome.error}")
+                results.append((name, False, str(outcome.error)))
+                continue
+            blank = [r for r, result in outcome.results.items() if result.blank]
+            if blank:
+                print(f"✗ Blank: {name} ({', '.join(blank)})")
+                results.append((name, False, f"blank in {', '.join(blank)}"))
+            else:
+                print(f"✓ Rendered: {name}")
+                results.append((name, True, "rendered"))
+            errors = [
+                r
+                for r, result in outcome.results.items()
+                if result.log and result.log.has_errors
+            ]
+            if errors:
+                print(f"  ! Page reported errors in {', '.join(errors)}")
+            if output_dir is not None:
+                target = output_dir / Path(name).with_suffix("")
+                target.mkdir(parents=True, exist_ok=True)
+                for aspect_ratio, result in outcome.results.items():
+                    (target / f"{aspect_ratio}.png").write_bytes(result.png)
+    finally:
+        # The pool only starts on a cache miss, stopping it is a no-op otherwise.
+        await pool.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Render all vega and cicero examples in desktop and mobile ratios."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of pages rendering in parallel",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=None,
+        help="Optionally write <output-dir>/<example>/<ratio>.png",
+    )
+    parser.add_argument(
+        "--capture",
+        choices=["viewport", "element", "content", "full_page"],
+        default="viewport",
+        help="What to capture; `element` clips to #vis",
+    )
+    parser.add_argument(
+        "--max-height",
+        type=int,
+        default=RenderOptions.max_height,
+        help="Maximum height of non-viewport captures",
+    )
+    parser.add_argument(
+        "--vega-renderer",
+        choices=["auto", "svg", "canvas"],
+        default="auto",
+        help="vega-embed renderer; `auto` picks SVG only for small specs with inline data",
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Keep animations, the real clock and unseeded Math.random",
+    )
+    parser.add_argument(
+        "--max-renders",
+        type=int,
+        default=500,
+        help="Recycle a browser context after this many renders (0 never does)",
+    )
+    parser.add_argument(
+        "--max-rss-mb",
+        type=int,
+        default=None,
+        help="Relaunch a browser once its processes use more resident memory",
+    )
+    parser.add_argument(
+        "--events",
+        type=Path,
+        default=None,
+        help="Append per-render timing events to this JSONL file",
+    )
+    args = parser.parse_args()
+    if args.events is not None:
+        add_render_hook(JsonlSink(args.events))
+
+    base_dir = Path(__file__).parent.resolve()
+    paths = sorted(p for pattern in EXAMPLE_GLOBS for p in base_dir.glob(pattern))
+    # Export Vega data like prepare_project*.py, so that its renders hit the cache.
+    jobs = [RenderJob(path, exports=("vega_data",)) for path in paths]
+
+    print(f"Rendering {len(jobs)} examples with concurrency={args.concurrency}\n")
+    options = RenderOptions(
+        capture=args.capture,
+        max_height=args.max_height,
+        vega_renderer=args.vega_renderer,
+        deterministic=not args.live,
+    )
+    pool = RenderPool(
+        browsers=1,
+        contexts_per_browser=args.concurrency,
+        max_renders_per_context=args.max_renders or None,
+        max_browser_rss_bytes=args.max_rss_mb * 2**20 if args.max_rss_mb else None,
+    )
+    results = asyncio.run(
+        render_all(jobs, args.concurrency, args.output_dir, options, pool)
+    )
+    stats = pool.stats()
+
+    failed = [r for r in results if not r[1]]
+    print(f"\n{'=' * 50}")
+    print(f"Summary: {len(results) - len(failed)} rendered, {len(failed)} failed")
+    if stats.renders:
+        print(
+            f"Browser: {stats.renders} page renders, "
+            f"{stats.contexts_recycled} contexts and "
+            f"{stats.browsers_recycled} browsers recycled, peak RSS "
+            f"{stats.peak_browser_rss_bytes / 2**20:.0f} MB"
+        )
+    if failed:
+        print("\nFailed examples:")
+        for name, _, error in failed:
+            print(f"  - {name}: {error}")
+    if args.events is not None:
+        print(
+            f"\nEvents written to {args.events}; summarize with "
+            f"`python -m vis2mobile_py.render.events report {args.events}`"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from vis2mobile_py.cli import main
+
+main()
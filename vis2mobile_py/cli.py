@@ -0,0 +1,76 @@
+"""
+Command line entry point, `python -m vis2mobile_py <command>`.
+
+    python -m vis2mobile_py render SOURCE=PROJECT [SOURCE=PROJECT ...] [--watch]
+
+renders each source visualization into `PROJECT/original_visualization/`
+(`desktop.png`, `desktop_on_mobile.png`, the render log and Vega data), and
+with `--watch` keeps re-rendering them as they or their assets change.
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from vis2mobile_py.render.pool import close_render_pool
+from vis2mobile_py.render.watch import WatchTarget, render_targets, watch
+
+
+def _target(value: str) -> WatchTarget:
+    source, sep, project = value.partition("=")
+    if not sep or not source or not project:
+        raise argparse.ArgumentTypeError(f"expected SOURCE=PROJECT, got {value!r}")
+    source = Path(source)
+    if source.suffix not in (".html", ".svg"):
+        raise argparse.ArgumentTypeError(f"{source} is not an HTML or SVG file")
+    return WatchTarget(source, Path(project))
+
+
+async def _render(args: argparse.Namespace) -> None:
+    try:
+        if args.watch:
+            await watch(args.targets, args.debounce_ms / 1000, args.poll)
+        else:
+            await render_targets(args.targets)
+    finally:
+        await close_render_pool()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m vis2mobile_py")
+    commands = parser.add_subparsers(dest="command", required=True)
+    render = commands.add_parser(
+        "render",
+        help="Render original visualizations into their projects",
+        description="Render each SOURCE into PROJECT/original_visualization/.",
+    )
+    render.add_argument(
+        "targets",
+        nargs="+",
+        type=_target,
+        metavar="SOURCE=PROJECT",
+        help="e.g. vega-examples/vega/02.html=vega-mobile-projects/vega-02",
+    )
+    render.add_argument(
+        "--watch",
+        action="store_true",
+        help="Re-render whenever a source or one of its local assets changes",
+    )
+    render.add_argument(
+        "--debounce-ms",
+        type=int,
+        default=100,
+        help="Wait this long after the last change before rendering",
+    )
+    render.add_argument(
+        "--poll",
+        action="store_true",
+        help="Poll files for changes instead of using inotify",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "render":
+        try:
+            asyncio.run(_render(args))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,110 @@
+import asyncio
+import os
+
+import httpx
+from google import genai
+from google.genai import types
+
+
+class PlannerClient:
+    """
+    Async Gemini client shared by every planner call of a process.
+
+    One `genai.Client` keeps one pool of keep-alive HTTP connections, so the
+    TLS handshake is paid once rather than once per plan. At most
+    `concurrency` requests are in flight at a time; further calls wait for a
+    free slot. `base_url` points the client at another endpoint, e.g. a local
+    fake server in tests.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        concurrency: int = 4,
+        timeout_ms: int | None = None,
+    ):
+        assert concurrency > 0, f"concurrency must be positive, got {concurrency}"
+        self.concurrency = concurrency
+        self._client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                base_url=base_url,
+                timeout=timeout_ms,
+                async_client_args={
+                    "limits": httpx.Limits(
+                        max_connections=concurrency,
+                        max_keepalive_connections=concurrency,
+                        keepalive_expiry=300,
+                    )
+                },
+            ),
+        )
+        self._slots = asyncio.Semaphore(concurrency)
+        self._closed = False
+
+    @property
+    def aio(self) -> genai.client.AsyncClient:
+        """The underlying async client, for calls other than `generate_content`."""
+        return self._client.aio
+
+    async def generate_content(
+        self,
+        model: str,
+        contents: types.ContentListUnionDict,
+        config: types.GenerateContentConfigOrDict | None = None,
+    ) -> types.GenerateContentResponse:
+        if self._closed:
+            raise RuntimeError("PlannerClient is closed")
+        async with self._slots:
+            return await self._client.aio.models.generate_content(
+                model=model, contents=contents, config=config
+            )
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        await self._client.aio.aclose()
+        self._client.close()
+
+    async def __aenter__(self) -> "PlannerClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+
+_default_client: PlannerClient | None = None
+_default_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_planner_client() -> PlannerClient:
+    """
+    Return the process-wide planner client, creating it on first use.
+
+    The API key is read from `GEMINI_KEY`. `VIS2MOBILE_LLM_BASE_URL` overrides
+    the endpoint and `VIS2MOBILE_LLM_CONCURRENCY` the number of concurrent
+    requests (4 by default). Like the render pool, the client is bound to the
+    event loop that created it, and a new one is created for another loop. Call
+    `close_planner_client()` before the event loop exits.
+    """
+    global _default_client, _default_client_loop
+    loop = asyncio.get_running_loop()
+    if _default_client is None or _default_client_loop is not loop:
+        _default_client = PlannerClient(
+            api_key=os.getenv("GEMINI_KEY"),
+            base_url=os.getenv("VIS2MOBILE_LLM_BASE_URL") or None,
+            concurrency=int(os.getenv("VIS2MOBILE_LLM_CONCURRENCY", "4")),
+        )
+        _default_client_loop = loop
+    return _default_client
+
+
+async def close_planner_client() -> None:
+    """Close the process-wide planner client, if it was created in this loop."""
+    global _default_client, _default_client_loop
+    client, loop = _default_client, _default_client_loop
+    _default_client, _default_client_loop = None, None
+    if client is not None and loop is asyncio.get_running_loop():
+        await client.aclose()
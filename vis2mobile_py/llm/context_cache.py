@@ -0,0 +1,324 @@
+"""
+Provider-side caching of the static prefix of planner prompts.
+
+Every planner prompt starts with the same sections, the action space document
+above all (see `PROMPT_TEMPLATE_STATIC_PREFIX`). Rather than uploading and
+processing them again for each of the dozens of projects of a corpus, the
+prefix is stored once as Gemini cached content and requests only send what
+follows it, referring to the cache by name.
+
+`ContextCacheRegistry` keeps the handle of the cached prefix of each model on
+disk, so that the separate `prepare_project*.py` processes of a batch share
+it. Handles are refreshed while in use, and replaced when the prefix (i.e.
+the document or the template) changes. `StubContextCacheBackend` keeps caches
+in memory, to exercise all of this offline.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Protocol
+
+from google.genai import errors, types
+
+from vis2mobile_py.llm.client import PlannerClient
+from vis2mobile_py.prompts.tokens import estimate_text_tokens
+from vis2mobile_py.render.cache import atomic_write, default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Smallest prefix Gemini accepts as cached content, by model family.
+MIN_CACHED_TOKENS = {"flash": 1024, "pro": 4096}
+
+
+def min_cached_tokens(model: str) -> int:
+    return MIN_CACHED_TOKENS["flash" if "flash" in model else "pro"]
+
+
+class ContextCacheMissing(Exception):
+    """Raised by a backend when a cache does not exist (anymore)."""
+
+
+class ContextCacheBackend(Protocol):
+    """Where cached prefixes live. Times are Unix timestamps in seconds."""
+
+    name: str
+    # Whether caches outlive the process, so that their handles are worth
+    # sharing with other processes.
+    persistent: bool
+    # Whether the model provider resolves cache names in requests. Prefixes
+    # of other backends are resolved locally and sent in full.
+    provider_side: bool
+
+    async def create(self, model: str, contents: list, ttl: float) -> tuple[str, float]:
+        """Cache `contents` for `model`, returning the cache name and expiry."""
+        ...
+
+    async def refresh(self, name: str, ttl: float) -> float:
+        """Extend the cache to expire in `ttl` seconds, returning the new expiry."""
+        ...
+
+    async def delete(self, name: str) -> None: ...
+
+    def resolve(self, name: str) -> list:
+        """The cached contents, for backends that are not `provider_side`."""
+        ...
+
+
+class GeminiContextCacheBackend:
+    """Gemini cached contents, created through the shared planner client."""
+
+    name = "gemini"
+    persistent = True
+    provider_side = True
+
+    def __init__(self, client: PlannerClient):
+        self.client = client
+
+    async def create(self, model: str, contents: list, ttl: float) -> tuple[str, float]:
+        cached = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=contents,
+                ttl=f"{int(ttl)}s",
+                display_name="vis2mobile-planner-prefix",
+            ),
+        )
+        return cached.name, cached.expire_time.timestamp()
+
+    async def refresh(self, name: str, ttl: float) -> float:
+        try:
+            cached = await self.client.aio.caches.update(
+                name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl)}s")
+            )
+        except errors.ClientError as e:
+            if e.code in (403, 404):
+                raise ContextCacheMissing(name) from e
+            raise
+        return cached.expire_time.timestamp()
+
+    async def delete(self, name: str) -> None:
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except errors.ClientError as e:
+            if e.code not in (403, 404):
+                raise
+
+
+class StubContextCacheBackend:
+    """
+    In-memory stand-in for a provider cache, for tests without network.
+    `entries` maps cache names to their model, contents and expiry, `calls`
+    counts the calls of every operation. The provider never sees its names:
+    requests get the cached contents back in place of the name (see
+    `resolve`), so together with a fake endpoint
+    (`VIS2MOBILE_LLM_BASE_URL`) planner calls run entirely offline.
+    """
+
+    name = "stub"
+    persistent = False
+    provider_side = False
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.entries: dict[str, dict] = {}
+        self.calls = {"create": 0, "refresh": 0, "delete": 0}
+        self._ids = itertools.count(1)
+
+    async def create(self, model: str, contents: list, ttl: float) -> tuple[str, float]:
+        self.calls["create"] += 1
+        name = f"cachedContents/stub-{next(self._ids)}"
+        expire_time = self.clock() + ttl
+        self.entries[name] = {
+            "model": model,
+            "contents": list(contents),
+            "expire_time": expire_time,
+        }
+        return name, expire_time
+
+    async def refresh(self, name: str, ttl: float) -> float:
+        self.calls["refresh"] += 1
+        self.resolve(name)
+        self.entries[name]["expire_time"] = self.clock() + ttl
+        return self.entries[name]["expire_time"]
+
+    async def delete(self, name: str) -> None:
+        self.calls["delete"] += 1
+        self.entries.pop(name, None)
+
+    def resolve(self, name: str) -> list:
+        """The contents cached as `name`, as a provider would prepend them."""
+        entry = self.entries.get(name)
+        if entry is None or entry["expire_time"] <= self.clock():
+            raise ContextCacheMissing(name)
+        return entry["contents"]
+
+
+def prefix_key(model: str, prefix: list) -> str:
+    """Content address of a prompt prefix for `model`."""
+    material = {"model": model, "parts": [str(part) for part in prefix]}
+    return hashlib.sha256(json.dumps(material).encode()).hexdigest()
+
+
+@dataclass
+class CacheHandle:
+    name: str
+    model: str
+    key: str
+    expire_time: float
+
+
+class ContextCacheRegistry:
+    """
+    Handles of the cached prompt prefix of each model. Handles of persistent
+    backends are stored in `<root>/<backend>.json` and shared between
+    processes under a file lock, others are kept in memory.
+
+    `handle()` returns a cache of the given prefix that is valid for at least
+    `refresh_margin` more seconds: the registered one, refreshed to `ttl` when
+    it is about to expire, or a new one. A prefix that differs from the
+    registered one, because the action space document or the template
+    changed, replaces it and the old cache is deleted. Prefixes shorter than
+    the provider accepts, or that the provider refuses, are not cached.
+    """
+
+    def __init__(
+        self,
+        backend: ContextCacheBackend,
+        ttl: float = 3600,
+        refresh_margin: float = 600,
+        root: str | Path | None = None,
+        clock=time.time,
+    ):
+        assert ttl > refresh_margin, "ttl must exceed refresh_margin"
+        self.backend = backend
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        root = (
+            Path(root) if root is not None else default_cache_dir() / "context-caches"
+        )
+        self.path = root / f"{backend.name}.json" if backend.persistent else None
+        self.clock = clock
+        self._handles: dict = {}
+        self._lock = asyncio.Lock()
+        self._refused: set[str] = set()
+
+    def _load(self) -> dict:
+        if self.path is None:
+            return dict(self._handles)
+        try:
+            return json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, handles: dict) -> None:
+        if self.path is None:
+            self._handles = handles
+        else:
+            atomic_write(self.path, json.dumps(handles, indent=2).encode())
+
+    @contextlib.asynccontextmanager
+    async def _exclusive(self):
+        """Hold the registry against other tasks and, if on disk, processes."""
+        async with self._lock:
+            if self.path is None:
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path.with_suffix(".lock"), os.O_RDWR | os.O_CREAT)
+            try:
+                await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                # Closing the file releases the lock.
+                os.close(fd)
+
+    async def handle(self, model: str, prefix: list) -> CacheHandle | None:
+        key = prefix_key(model, prefix)
+        if key in self._refused:
+            return None
+        tokens = sum(estimate_text_tokens(p) for p in prefix if isinstance(p, str))
+        if tokens < min_cached_tokens(model):
+            return None
+
+        async with self._exclusive():
+            handles = self._load()
+            entry = handles.get(model)
+            now = self.clock()
+            if entry is not None and entry["key"] != key:
+                await self.backend.delete(entry["name"])
+                entry = None
+            if entry is not None and entry["expire_time"] - now < self.refresh_margin:
+                try:
+                    entry["expire_time"] = await self.backend.refresh(
+                        entry["name"], self.ttl
+                    )
+                except ContextCacheMissing:
+                    entry = None
+            if entry is None:
+                try:
+                    name, expire_time = await self.backend.create(
+                        model, prefix, self.ttl
+                    )
+                except errors.APIError as e:
+                    logger.warning("Not caching the prompt prefix for %s: %s", model, e)
+                    self._refused.add(key)
+                    handles.pop(model, None)
+                    self._save(handles)
+                    return None
+                entry = {"name": name, "key": key, "expire_time": expire_time}
+            handles[model] = entry
+            self._save(handles)
+            return CacheHandle(model=model, **entry)
+
+    async def invalidate(self, handle: CacheHandle) -> None:
+        """Forget `handle`, e.g. after the provider reported it missing."""
+        async with self._exclusive():
+            handles = self._load()
+            if handles.get(handle.model, {}).get("name") == handle.name:
+                del handles[handle.model]
+                self._save(handles)
+        await self.backend.delete(handle.name)
+
+
+_default_registry: ContextCacheRegistry | None = None
+
+
+def get_context_cache(client: PlannerClient) -> ContextCacheRegistry | None:
+    """
+    Registry of cached prompt prefixes for `client`, or `None` if disabled.
+
+    `VIS2MOBILE_CONTEXT_CACHE` selects the backend: `gemini` (the default),
+    `stub` (in memory, nothing is sent to the provider) or `0` to send every
+    prompt in full. `VIS2MOBILE_CONTEXT_CACHE_TTL` sets how long caches live
+    after their last use, in seconds (3600 by default).
+    """
+    global _default_registry
+    backend_name = os.getenv("VIS2MOBILE_CONTEXT_CACHE", "gemini")
+    if backend_name == "0":
+        return None
+    assert backend_name in ["gemini", "stub"], (
+        f"Unknown VIS2MOBILE_CONTEXT_CACHE backend {backend_name}"
+    )
+    registry = _default_registry
+    if (
+        registry is None
+        or registry.backend.name != backend_name
+        or getattr(registry.backend, "client", client) is not client
+    ):
+        if backend_name == "gemini":
+            backend = GeminiContextCacheBackend(client)
+        else:
+            backend = StubContextCacheBackend()
+        ttl = float(os.getenv("VIS2MOBILE_CONTEXT_CACHE_TTL", "3600"))
+        registry = ContextCacheRegistry(backend, ttl=ttl, refresh_margin=ttl / 6)
+        _default_registry = registry
+    return registry
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from google.genai import errors, types
+
+from vis2mobile_py.llm.client import PlannerClient
+from vis2mobile_py.llm.context_cache import ContextCacheRegistry
+from vis2mobile_py.prompts.planner import PROMPT_TEMPLATE_VERSION
+from vis2mobile_py.render.cache import atomic_write, default_cache_dir
+
+
+def _part_digest(part) -> str:
+    if isinstance(part, str):
+        data = part.encode()
+    elif isinstance(part, types.Part) and part.inline_data is not None:
+        data = part.inline_data.mime_type.encode() + b"\0" + part.inline_data.data
+    elif isinstance(part, types.Part):
+        data = part.model_dump_json(exclude_none=True).encode()
+    else:
+        data = json.dumps(part, sort_keys=True).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def plan_cache_key(
+    contents: list, model: str, config: types.GenerateContentConfig | None
+) -> str:
+    """
+    Content address of a plan request.
+
+    The prompt parts carry the source (or its snapshot), the action space
+    document and the bytes of the encoded images, so any change to them, to
+    `PROMPT_TEMPLATE_VERSION`, to the model or to its config yields a new key.
+    """
+    material = {
+        "prompt_template_version": PROMPT_TEMPLATE_VERSION,
+        "model": model,
+        "config": config.model_dump(mode="json", exclude_none=True) if config else None,
+        "contents": [_part_digest(part) for part in contents],
+    }
+    encoded = json.dumps(material, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class PlanCache:
+    """
+    On-disk cache of generated transform plans, `<key[:2]>/<key>.md` with a
+    `<key>.json` sidecar recording the model and when the plan was generated.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root is not None else default_cache_dir() / "plans"
+
+    def _entry(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str) -> str | None:
+        try:
+            return self._entry(key, ".md").read_text()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, plan: str, metadata: dict | None = None) -> Path:
+        if metadata is not None:
+            atomic_write(self._entry(key, ".json"), json.dumps(metadata).encode())
+        return atomic_write(self._entry(key, ".md"), plan.encode())
+
+
+_default_cache: PlanCache | None = None
+
+
+def get_plan_cache() -> PlanCache | None:
+    """
+    Process-wide plan cache, or `None` if disabled via `VIS2MOBILE_PLAN_CACHE=0`.
+    It lives next to the render cache (see `VIS2MOBILE_CACHE_DIR`).
+    """
+    global _default_cache
+    if os.getenv("VIS2MOBILE_PLAN_CACHE", "1") == "0":
+        return None
+    if _default_cache is None:
+        _default_cache = PlanCache()
+    return _default_cache
+
+
+@dataclass
+class Plan:
+    text: str
+    key: str
+    cache_hit: bool = False
+    # Name of the provider cache the static prompt prefix was served from.
+    context_cache: str | None = None
+
+
+async def generate_plan(
+    client: PlannerClient,
+    model: str,
+    contents: list,
+    config: types.GenerateContentConfig | None = None,
+    refresh: bool = False,
+    context_cache: ContextCacheRegistry | None = None,
+    static_prefix_parts: int = 0,
+) -> Plan:
+    """
+    Generate a transform plan, or return the cached plan of an identical
+    request. `refresh=True` always calls the model and replaces the cached plan.
+
+    With a `context_cache`, the first `static_prefix_parts` parts of
+    `contents` are served from a provider-side cache and only the rest is
+    sent. Plans are cached by the full contents either way.
+    """
+    key = plan_cache_key(contents, model, config)
+    cache = get_plan_cache()
+    if cache is not None and not refresh:
+        text = cache.get(key)
+        if text is not None:
+            return Plan(text, key, cache_hit=True)
+
+    handle = None
+    if context_cache is not None and static_prefix_parts:
+        handle = await context_cache.handle(model, contents[:static_prefix_parts])
+    if handle is None:
+        response = await client.generate_content(model, contents, config)
+    elif not context_cache.backend.provider_side:
+        # A local cache: send its contents in place of the name, like the
+        # provider would expand it.
+        prefix = context_cache.backend.resolve(handle.name)
+        response = await client.generate_content(
+            model, [*prefix, *contents[static_prefix_parts:]], config
+        )
+    else:
+        cached_config = (config or types.GenerateContentConfig()).model_copy(
+            update={"cached_content": handle.name}
+        )
+        try:
+            response = await client.generate_content(
+                model, contents[static_prefix_parts:], cached_config
+            )
+        except errors.ClientError as e:
+            if e.code not in (403, 404):
+                raise
+            # The cache was deleted or expired behind the registry's back.
+            await context_cache.invalidate(handle)
+            handle = None
+            response = await client.generate_content(model, contents, config)
+
+    text = response.parts[0].text
+    usage = response.usage_metadata
+    if cache is not None:
+        cache.put(
+            key,
+            text,
+            {
+                "model": model,
+                "created": time.time(),
+                "cached_tokens": usage.cached_content_token_count if usage else None,
+            },
+        )
+    return Plan(text, key, context_cache=handle.name if handle else None)
@@ -0,0 +1,193 @@
+import base64
+import io
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Literal
+
+from google.genai import types
+from PIL import Image
+
+from vis2mobile_py.prompts.tokens import estimate_text_tokens
+
+# Gemini 3 spends at most this many tokens on one image, by media resolution.
+# Older models and an unspecified resolution are only bounded by tiling.
+GEMINI_MEDIA_RESOLUTION_TOKENS = {
+    "MEDIA_RESOLUTION_LOW": 280,
+    "MEDIA_RESOLUTION_MEDIUM": 560,
+    "MEDIA_RESOLUTION_HIGH": 1120,
+}
+_GEMINI_TILE = 768
+_GEMINI_TOKENS_PER_TILE = 258
+
+
+def gemini_image_tokens(
+    width: int, height: int, media_resolution: str | None = None
+) -> int:
+    """
+    Tokens Gemini counts for a `width`x`height` image: images up to 384 px
+    on both sides take one tile of 258 tokens, larger ones one per 768 px
+    tile, capped by the `media_resolution` budget.
+    """
+    if width <= _GEMINI_TILE // 2 and height <= _GEMINI_TILE // 2:
+        tokens = _GEMINI_TOKENS_PER_TILE
+    else:
+        tiles = math.ceil(width / _GEMINI_TILE) * math.ceil(height / _GEMINI_TILE)
+        tokens = tiles * _GEMINI_TOKENS_PER_TILE
+    cap = GEMINI_MEDIA_RESOLUTION_TOKENS.get(str(media_resolution or ""))
+    return min(tokens, cap) if cap else tokens
+
+
+def openai_image_tokens(
+    width: int, height: int, detail: Literal["low", "high", "auto"] = "auto"
+) -> int:
+    """
+    Tokens OpenAI counts for a `width`x`height` image: 85 at low detail,
+    otherwise 85 plus 170 per 512 px tile once the image is fit within
+    2048x2048 and its short side within 768 px. `"auto"` is counted as high.
+    """
+    if detail == "low":
+        return 85
+    scale = min(1, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+@dataclass
+class PromptEstimate:
+    """Pre-flight size of a planner prompt, as `estimate_prompt` counts it."""
+
+    ai_service: str
+    text_tokens: int
+    image_tokens: list[int]
+    image_sizes: list[tuple[int, int]]
+    request_bytes: int
+    # Changes made to fit a `PromptBudget`, in the order they were made.
+    adjustments: list[str] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.text_tokens + sum(self.image_tokens)
+
+    def to_dict(self) -> dict:
+        return {
+            "ai_service": self.ai_service,
+            "total_tokens": self.total_tokens,
+            "text_tokens": self.text_tokens,
+            "image_tokens": self.image_tokens,
+            "image_sizes": [list(size) for size in self.image_sizes],
+            "request_bytes": self.request_bytes,
+            "adjustments": self.adjustments,
+        }
+
+
+def _image_size(data: bytes) -> tuple[int, int]:
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+def _gemini_payload(prompt: list) -> tuple[dict, list[bytes]]:
+    parts, images = [], []
+    for part in prompt:
+        if isinstance(part, str):
+            parts.append({"text": part})
+        elif isinstance(part, types.Part) and part.inline_data:
+            data = part.inline_data.data
+            images.append(data)
+            parts.append(
+                {
+                    "inlineData": {
+                        "mimeType": part.inline_data.mime_type,
+                        "data": base64.b64encode(data).decode("ascii"),
+                    }
+                }
+            )
+        elif isinstance(part, types.Part) and part.text is not None:
+            parts.append({"text": part.text})
+    return {"contents": [{"role": "user", "parts": parts}]}, images
+
+
+def estimate_prompt(
+    prompt,
+    ai_service: Literal["openai", "gemini"],
+    media_resolution: str | None = None,
+) -> PromptEstimate:
+    """
+    Estimate the tokens and request size of a prompt built by `get_prompt`
+    without sending it: text with `estimate_text_tokens`, images from their
+    dimensions (and `media_resolution` for Gemini), and bytes as the JSON
+    body the API would receive, images base64 encoded.
+    """
+    if ai_service == "openai":
+        texts = [c["text"] for c in prompt["content"] if c["type"] == "input_text"]
+        images = [c for c in prompt["content"] if c["type"] == "input_image"]
+        sizes = [
+            _image_size(base64.b64decode(c["image_url"].split(",", 1)[1]))
+            for c in images
+        ]
+        image_tokens = [
+            openai_image_tokens(w, h, c.get("detail", "auto"))
+            for c, (w, h) in zip(images, sizes)
+        ]
+        payload = {"input": [prompt]}
+    else:
+        payload, image_data = _gemini_payload(prompt)
+        texts = [p["text"] for p in payload["contents"][0]["parts"] if "text" in p]
+        sizes = [_image_size(data) for data in image_data]
+        image_tokens = [gemini_image_tokens(w, h, media_resolution) for w, h in sizes]
+    return PromptEstimate(
+        ai_service=ai_service,
+        text_tokens=sum(estimate_text_tokens(text) for text in texts),
+        image_tokens=image_tokens,
+        image_sizes=sizes,
+        request_bytes=len(json.dumps(payload).encode("utf-8")),
+    )
+
+
+@dataclass(frozen=True)
+class PromptBudget:
+    """
+    Limits a planner prompt must fit before it is sent.
+
+    Over budget, `get_prompt` first scales images down (halving their pixels,
+    not below `min_image_pixels`) when the request is too large in bytes, and
+    reduces the source (not below `min_source_tokens`, see `reduce_source`)
+    when it has too many tokens, then tries the other remedy. With
+    `refuse=True`, or when neither helps, it raises `PromptBudgetExceeded`.
+    """
+
+    max_tokens: int | None = None
+    max_request_bytes: int | None = None
+    min_image_pixels: int = 640 * 360
+    min_source_tokens: int = 2000
+    refuse: bool = False
+
+    def excess(self, estimate: PromptEstimate) -> tuple[int, int]:
+        """Tokens and bytes by which `estimate` is over budget (0 if within)."""
+        tokens = bytes_ = 0
+        if self.max_tokens is not None:
+            tokens = max(estimate.total_tokens - self.max_tokens, 0)
+        if self.max_request_bytes is not None:
+            bytes_ = max(estimate.request_bytes - self.max_request_bytes, 0)
+        return tokens, bytes_
+
+
+class PromptBudgetExceeded(RuntimeError):
+    """Raised when a planner prompt cannot be made to fit its `PromptBudget`."""
+
+    def __init__(self, source: str, estimate: PromptEstimate, budget: PromptBudget):
+        limits = []
+        if budget.max_tokens is not None:
+            limits.append(f"{estimate.total_tokens:,}/{budget.max_tokens:,} tokens")
+        if budget.max_request_bytes is not None:
+            limits.append(
+                f"{estimate.request_bytes:,}/{budget.max_request_bytes:,} bytes"
+            )
+        super().__init__(
+            f"Planner prompt for {source} is over budget ({', '.join(limits)})"
+        )
+        self.source = source
+        self.estimate = estimate
+        self.budget = budget
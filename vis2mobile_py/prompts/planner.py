@@ -1,8 +1,32 @@
-from vis2mobile_py.utils import html_to_image
+from vis2mobile_py.prompts.estimate import (
+    PromptBudget,
+    PromptBudgetExceeded,
+    estimate_prompt,
+)
+from vis2mobile_py.prompts.reducer import (
+    DEFAULT_REDUCERS,
+    SourceReducer,
+    reduce_source,
+)
+from vis2mobile_py.prompts.tokens import estimate_text_tokens
+from vis2mobile_py.render.encode import EncodedImage, ImageBudget, encode_image
+from vis2mobile_py.render.scene import describe_scene
+from vis2mobile_py.utils import html_to_images
+from google.genai import types
+from dataclasses import replace
 from pathlib import Path
+import itertools
+import math
 from typing import Literal
 
-PROMPT_TEMPLATE_PART1 = """
+# Bump whenever the templates or the way prompts are assembled change, so
+# that cached plans (see `vis2mobile_py.llm.plan_cache`) are regenerated.
+PROMPT_TEMPLATE_VERSION = "2"
+
+# Prompts are laid out static sections first: this prefix is identical for
+# every visualization, so providers can cache it across planner calls (see
+# `vis2mobile_py.llm.context_cache`). Everything that varies comes after it.
+PROMPT_TEMPLATE_STATIC_PREFIX = """
 # Vis2Mobile Project
 
 ## Objective
@@ -38,26 +62,27 @@ You need to act as a planner to plan how to fulfill the following missions:
 
 ## Related Information
 
-### Source of the original SVG or HTML file
+### Vis2Mobile Design Action Space
 
-Below is the source code of the original SVG or HTML file that you need to transform into a mobile visualization.
+Below is the document of Vis2Mobile Design Action Space, `mobile-vis-design-action-space.md`, which details the design space of visualizations and action space of what actions you can take to convert the visualization into a mobile friendly one. 
 
 ```
-{source_code}
+{vis2mobile_design_action_space}
 ```
-
-Below, the first image is the rendered original visualization that is tailored for desktop `desktop.png`. I also rendered it in mobile aspect ratio `desktop_on_mobile.png`, check the second image.
 """
 
-PROMPT_TEMPLATE_PART2 = """### Vis2Mobile Design Action Space
+PROMPT_TEMPLATE_SOURCE = """### Source of the original SVG or HTML file
 
-Below is the document of Vis2Mobile Design Action Space, `mobile-vis-design-action-space.md`, which details the design space of visualizations and action space of what actions you can take to convert the visualization into a mobile friendly one. 
+Below is the source code of the original SVG or HTML file that you need to transform into a mobile visualization.
 
 ```
-{vis2mobile_design_action_space}
+{source_code}
 ```
 
-## Task and Requirements
+Below, the first image is the rendered original visualization that is tailored for desktop `desktop.png`. I also rendered it in mobile aspect ratio `desktop_on_mobile.png`, check the second image.
+"""
+
+PROMPT_TEMPLATE_TASK = """## Task and Requirements
 
 1. Check the source code of the original SVG or HTML file and its rendered results carefully. Understand the full details in the visualization and the appearance of the original desktop version. You should take note all information presented in the desktop version. Also, think about the issues in the version rendered in mobile aspect ratio
 2. Read Vis2Mobile Design Action Space document carefully. Based on your understanding of the visualization and the design and action spaces, give your reasoning and plan about how to transform the visualization into a mobile friendly one. Like what steps and actions to take.
@@ -72,48 +97,223 @@ HARD REQUIREMENT: **Think about how to ensure readability on mobile screen. DO N
 """
 
 
+# Images and source are adjusted at most this many times to fit a budget.
+_MAX_BUDGET_STEPS = 16
+
+# Number of leading prompt parts made of `PROMPT_TEMPLATE_STATIC_PREFIX`.
+STATIC_PREFIX_PARTS = 1
+
+SourceMode = Literal["source", "scene", "scene+source"]
+
+
+def _truncate(text: str, max_chars: int | None) -> str:
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    omitted = len(text) - max_chars
+    return text[:max_chars] + f"\n... [{omitted} characters omitted]"
+
+
+def _source_section(
+    source_code: str,
+    scene: dict | None,
+    source_mode: SourceMode,
+    max_source_chars: int | None,
+    max_scene_chars: int,
+) -> str:
+    if source_mode == "source":
+        return _truncate(source_code, max_source_chars)
+    section = (
+        "Snapshot of the rendered desktop page (texts, shapes, axes and legends):\n"
+        + describe_scene(scene, max_scene_chars)
+    )
+    if source_mode == "scene+source":
+        section += "\n\nSource code:\n" + _truncate(source_code, max_source_chars)
+    return section
+
+
+def _assemble_prompt(
+    ai_service: Literal["openai", "gemini"],
+    static_prefix: str,
+    source_text: str,
+    desktop_image: EncodedImage,
+    mobile_image: EncodedImage,
+):
+    if ai_service == "openai":
+        return {
+            "role": "user",
+            "content": [
+                {"type": "input_text", "text": static_prefix},
+                {"type": "input_text", "text": source_text},
+                {
+                    "type": "input_image",
+                    "image_url": desktop_image.data_url(),
+                    "detail": "high",
+                },
+                {
+                    "type": "input_image",
+                    "image_url": mobile_image.data_url(),
+                },
+                {"type": "input_text", "text": PROMPT_TEMPLATE_TASK},
+            ],
+        }
+    return [
+        static_prefix,
+        source_text,
+        types.Part.from_bytes(
+            data=desktop_image.data, mime_type=desktop_image.mime_type
+        ),
+        types.Part.from_bytes(data=mobile_image.data, mime_type=mobile_image.mime_type),
+        PROMPT_TEMPLATE_TASK,
+    ]
+
+
 async def get_prompt(
     source_path: str | Path,
     vis2mobile_design_action_space_path: str | Path,
     ai_service: Literal["openai", "gemini"],
+    image_budget: ImageBudget | None = None,
+    with_metadata: bool = False,
+    source_mode: SourceMode = "source",
+    max_source_chars: int | None = None,
+    max_scene_chars: int = 12000,
+    max_source_tokens: int | None = 100_000,
+    source_reducers: tuple[SourceReducer, ...] = DEFAULT_REDUCERS,
+    budget: PromptBudget | None = None,
+    media_resolution: str | None = None,
 ):
+    """
+    Build the planner prompt for `ai_service`.
+
+    Rendered images are sent as PNG as rendered, or encoded within
+    `image_budget` (e.g. WebP, capped pixels and bytes per image). With
+    `with_metadata=True`, returns `(prompt, metadata)` where metadata records
+    the original and encoded size of every image.
+
+    `source_mode` selects how the original is described in text: its source
+    (`"source"`), a snapshot of the rendered page's visible texts with their
+    boxes, font sizes and colors, its shapes and its axes and legends
+    (`"scene"`, see `snapshot_scene`), or both (`"scene+source"`). Sources of
+    large charts are mostly inline data, so the snapshot keeps the prompt
+    bounded: it is capped at `max_scene_chars` and the source, when sent, at
+    `max_source_chars` (by default unlimited, or 20000 next to a snapshot).
+
+    Sources estimated above `max_source_tokens` are first shrunk by
+    `source_reducers` (see `reduce_source`): bundled libraries, inline
+    datasets, SVG path data and repeated marks are replaced by summaries, and
+    the prompt lists exactly what was left out. Smaller sources are sent as
+    they are; `None` never reduces them.
+
+    Every prompt is estimated before it is returned (see `estimate_prompt`,
+    Gemini image tokens depend on `media_resolution`); the estimate is
+    `metadata["estimate"]`. A prompt over `budget` has its images scaled
+    down and its source reduced until it fits, or raises
+    `PromptBudgetExceeded` (see `PromptBudget`).
+
+    The prompt starts with `STATIC_PREFIX_PARTS` parts that only depend on
+    the action space document, followed by the source, the images and the
+    task, so that the prefix can be served from a provider-side cache.
+    """
     assert ai_service in ["openai", "gemini"]
+    assert source_mode in ["source", "scene", "scene+source"]
+    if max_source_chars is None and source_mode == "scene+source":
+        max_source_chars = 20000
 
     with open(source_path, "r") as f:
         source_code = f.read()
     with open(vis2mobile_design_action_space_path, "r") as f:
         vis2mobile_design_action_space = f.read()
 
-    text_prompt_part1 = PROMPT_TEMPLATE_PART1.format(
-        source_code=source_code,
+    renders = await html_to_images(
+        source_path,
+        ratios=["desktop", "mobile"],
+        return_type="result",
+        scene=source_mode != "source",
     )
-    text_prompt_part2 = PROMPT_TEMPLATE_PART2.format(
+    static_prefix = PROMPT_TEMPLATE_STATIC_PREFIX.format(
         vis2mobile_design_action_space=vis2mobile_design_action_space,
     )
-    if ai_service == "openai":
-        desktop_image_base64 = await html_to_image(
-            source_path, aspect_ratio="desktop", return_type="base64_png"
+
+    adjustments = []
+    previous_source_tokens = None
+    for step in itertools.count():
+        reduction = None
+        if max_source_tokens is not None:
+            reduction = reduce_source(source_code, max_source_tokens, source_reducers)
+        sent_source = source_code
+        if reduction is not None and reduction.reduced:
+            sent_source = f"{reduction.report()}\n\n{reduction.text}"
+        source_section = _source_section(
+            sent_source,
+            renders["desktop"].scene,
+            source_mode,
+            max_source_chars,
+            max_scene_chars,
         )
-        mobile_image_base64 = await html_to_image(
-            source_path, aspect_ratio="mobile", return_type="base64_png"
+        source_text = PROMPT_TEMPLATE_SOURCE.format(source_code=source_section)
+        desktop_image = encode_image(renders["desktop"].png, image_budget)
+        mobile_image = encode_image(renders["mobile"].png, image_budget)
+        prompt = _assemble_prompt(
+            ai_service, static_prefix, source_text, desktop_image, mobile_image
         )
-        return {
-            "role": "user",
-            "content": [
-                {"type": "input_text", "text": text_prompt_part1},
-                {
-                    "type": "input_image",
-                    "image_url": f"data:image/png;base64,{desktop_image_base64}",
-                    "detail": "high",
-                },
-                {
-                    "type": "input_image",
-                    "image_url": f"data:image/png;base64,{mobile_image_base64}",
-                },
-                {"type": "input_text", "text": text_prompt_part2},
-            ],
-        }
-    else:
-        desktop_image = await html_to_image(source_path, aspect_ratio="desktop")
-        mobile_image = await html_to_image(source_path, aspect_ratio="mobile")
-        return [text_prompt_part1, desktop_image, mobile_image, text_prompt_part2]
+        estimate = estimate_prompt(prompt, ai_service, media_resolution)
+        estimate.adjustments = adjustments
+        if budget is None:
+            break
+        excess_tokens, excess_bytes = budget.excess(estimate)
+        if not (excess_tokens or excess_bytes):
+            break
+        if budget.refuse or step >= _MAX_BUDGET_STEPS:
+            raise PromptBudgetExceeded(str(source_path), estimate, budget)
+
+        # Images dominate the bytes of a request and the source its tokens.
+        source_tokens = (
+            reduction.tokens if reduction else estimate_text_tokens(source_code)
+        )
+        source_chars = len(reduction.text) if reduction else len(source_code)
+        if excess_bytes:
+            needed = math.ceil(excess_bytes * source_tokens / max(source_chars, 1))
+        else:
+            needed = excess_tokens
+        pixels = max(
+            image.width * image.height for image in (desktop_image, mobile_image)
+        )
+        can_shrink_images = pixels // 2 >= budget.min_image_pixels
+        # Reducing again is pointless once a reduction no longer helps.
+        can_reduce_source = (
+            source_mode != "scene"
+            and source_tokens > budget.min_source_tokens
+            and (
+                previous_source_tokens is None or source_tokens < previous_source_tokens
+            )
+        )
+        if (excess_bytes and can_shrink_images) or not can_reduce_source:
+            if not can_shrink_images:
+                raise PromptBudgetExceeded(str(source_path), estimate, budget)
+            image_budget = replace(
+                image_budget or ImageBudget(), max_pixels=pixels // 2
+            )
+            adjustments.append(f"images scaled down to {pixels // 2:,} pixels")
+        else:
+            previous_source_tokens = source_tokens
+            max_source_tokens = max(source_tokens - needed, budget.min_source_tokens)
+            adjustments.append(f"source reduced to {max_source_tokens:,} tokens")
+
+    metadata = {
+        "images": {
+            "desktop": desktop_image.metadata(),
+            "mobile": mobile_image.metadata(),
+        },
+        "source": {
+            "mode": source_mode,
+            "source_chars": len(source_code),
+            "sent_chars": len(source_section),
+            "reduction": reduction.metadata() if reduction else None,
+        },
+        "estimate": estimate.to_dict(),
+        # The leading prompt parts that are the same for every visualization.
+        "static_prefix": {
+            "parts": STATIC_PREFIX_PARTS,
+            "tokens": estimate_text_tokens(static_prefix),
+        },
+    }
+    return (prompt, metadata) if with_metadata else prompt
@@ -0,0 +1,418 @@
+"""
+Shrinks the source of a visualization before it is inlined into a prompt.
+
+Sources are dominated by content the planner does not need verbatim: bundled
+libraries, inline datasets of thousands of rows and SVG path data. A reducer
+is a function taking the source and returning the reduced source together
+with the `Elision`s it made; `reduce_source` applies reducers, least lossy
+first, until the source fits a token budget, and reports exactly what was
+left out.
+"""
+
+import json
+import re
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+
+from vis2mobile_py.prompts.tokens import estimate_text_tokens
+
+
+@dataclass
+class Elision:
+    """One thing a reducer left out of the source."""
+
+    reducer: str
+    what: str
+    chars: int
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+SourceReducer = Callable[[str], tuple[str, list[Elision]]]
+
+
+@dataclass
+class ReducedSource:
+    text: str
+    original_chars: int
+    original_tokens: int
+    tokens: int
+    elisions: list[Elision] = field(default_factory=list)
+    truncated_chars: int = 0
+
+    @property
+    def reduced(self) -> bool:
+        return bool(self.elisions or self.truncated_chars)
+
+    def report(self) -> str:
+        """What was left out, one line per elision, for the prompt."""
+        if not self.reduced:
+            return ""
+        lines = [
+            f"The source was reduced from {self.original_chars:,} to "
+            f"{len(self.text):,} characters. Left out:"
+        ]
+        lines += [f"- {e.what} ({e.chars:,} characters)" for e in self.elisions]
+        if self.truncated_chars:
+            lines.append(
+                f"- the last {self.truncated_chars:,} characters (truncated to fit)"
+            )
+        return "\n".join(lines)
+
+    def metadata(self) -> dict:
+        return {
+            "original_chars": self.original_chars,
+            "original_tokens": self.original_tokens,
+            "chars": len(self.text),
+            "tokens": self.tokens,
+            "elisions": [e.to_dict() for e in self.elisions],
+            "truncated_chars": self.truncated_chars,
+        }
+
+
+# --- Scripts and styles ------------------------------------------------------
+
+_SCRIPT_RE = re.compile(r"(<script\b[^>]*>)(.*?)(</script\s*>)", re.S | re.I)
+_STYLE_RE = re.compile(r"(<style\b[^>]*>)(.*?)(</style\s*>)", re.S | re.I)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+# Plain rules only; at-rules such as @media keep their nested blocks intact.
+_CSS_RULE_RE = re.compile(r"(^|[{};])(\s*)([^{};@]+)\{([^{}]*)\}")
+_CLASS_ATTR_RE = re.compile(r"""\sclass\s*=\s*["']([^"']*)["']""", re.I)
+_ID_ATTR_RE = re.compile(r"""\sid\s*=\s*["']([^"']*)["']""", re.I)
+_DATA_URI_RE = re.compile(r"data:[\w/+.-]+(?:;[\w=.-]+)*,[^\"')\s]{200,}")
+
+
+def _is_bundled_library(script: str) -> bool:
+    # Minified bundles are long with very long lines; the code that draws the
+    # chart (a spec and its `vegaEmbed` call, D3 code) is kept.
+    if len(script) < 20000 or "vegaEmbed(" in script:
+        return False
+    lines = script.count("\n") + 1
+    return len(script) / lines > 300
+
+
+def _unused_css_rules(source: str) -> Callable[[re.Match], str]:
+    classes = {
+        name for m in _CLASS_ATTR_RE.finditer(source) for name in m.group(1).split()
+    }
+    ids = {m.group(1) for m in _ID_ATTR_RE.finditer(source)}
+
+    def used(selector: str) -> bool:
+        names = re.findall(r"\.([\w-]+)", selector)
+        refs = re.findall(r"#([\w-]+)", selector)
+        return all(n in classes for n in names) and all(r in ids for r in refs)
+
+    def replace(match: re.Match) -> str:
+        selectors = [s for s in match.group(3).split(",") if used(s)]
+        if not selectors:
+            return match.group(1)
+        return (
+            f"{match.group(1)}{match.group(2)}{','.join(selectors).strip()} "
+            f"{{{match.group(4)}}}"
+        )
+
+    return replace
+
+
+def strip_unused_code(source: str) -> tuple[str, list[Elision]]:
+    """
+    Drop bundled libraries inlined in `<script>`, CSS comments and rules whose
+    class or id selectors match nothing in the document, and long `data:`
+    URIs (embedded fonts and images).
+    """
+    elisions = []
+
+    def script(match: re.Match) -> str:
+        body = match.group(2)
+        if not _is_bundled_library(body):
+            return match.group(0)
+        elisions.append(
+            Elision("strip_unused_code", "an inlined minified library", len(body))
+        )
+        return f"{match.group(1)}/* minified library */{match.group(3)}"
+
+    source = _SCRIPT_RE.sub(script, source)
+
+    css_chars = 0
+    replace_rule = _unused_css_rules(source)
+
+    def style(match: re.Match) -> str:
+        nonlocal css_chars
+        body = _CSS_COMMENT_RE.sub("", match.group(2))
+        body = _CSS_RULE_RE.sub(replace_rule, body)
+        css_chars += len(match.group(2)) - len(body)
+        return match.group(1) + body + match.group(3)
+
+    source = _STYLE_RE.sub(style, source)
+    if css_chars > 0:
+        elisions.append(
+            Elision(
+                "strip_unused_code",
+                "CSS comments and rules matching nothing",
+                css_chars,
+            )
+        )
+
+    uris = [m.group(0) for m in _DATA_URI_RE.finditer(source)]
+    if uris:
+        source = _DATA_URI_RE.sub(
+            lambda m: m.group(0)[: m.group(0).index(",") + 1] + "...", source
+        )
+        elisions.append(
+            Elision(
+                "strip_unused_code",
+                f"the payload of {len(uris)} data: URIs",
+                sum(len(u) for u in uris),
+            )
+        )
+    return source, elisions
+
+
+# --- Inline data -------------------------------------------------------------
+
+_DATA_KEY_RE = re.compile(r"""["']?\b(datasets|values)\b["']?\s*:\s*""")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _describe_field(name: str, values: list) -> str:
+    present = [v for v in values if v is not None]
+    nulls = len(values) - len(present)
+    suffix = f", {nulls} null" if nulls else ""
+    if present and all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in present
+    ):
+        mean = sum(present) / len(present)
+        return (
+            f"{name} (number, {min(present):g} .. {max(present):g}, "
+            f"mean {mean:.4g}{suffix})"
+        )
+    if present and all(isinstance(v, str) and _DATE_RE.match(v) for v in present):
+        return f"{name} (date, {min(present)} .. {max(present)}{suffix})"
+    if present and all(isinstance(v, str) for v in present):
+        counts = Counter(present)
+        top = ", ".join(json.dumps(v) for v, _ in counts.most_common(5))
+        more = ", ..." if len(counts) > 5 else ""
+        return f"{name} (string, {len(counts)} distinct: {top}{more}{suffix})"
+    kinds = sorted({type(v).__name__ for v in present}) or ["null"]
+    return f"{name} ({'/'.join(kinds)}{suffix})"
+
+
+def _summarize_rows(rows: list, sample_rows: int) -> str:
+    step = (len(rows) - 1) / (sample_rows - 1) if sample_rows > 1 else len(rows)
+    sample = [rows[round(i * step)] for i in range(min(sample_rows, len(rows)))]
+    fields = list(dict.fromkeys(k for row in rows for k in row))
+    described = "; ".join(
+        _describe_field(name, [row.get(name) for row in rows]) for name in fields
+    )
+    shown = ", ".join(json.dumps(row) for row in sample)
+    return (
+        f"[{shown} /* {len(rows)} rows, {len(sample)} evenly spaced rows shown. "
+        f"Fields: {described} */]"
+    )
+
+
+def summarize_inline_data(
+    source: str, max_rows: int = 20, sample_rows: int = 5
+) -> tuple[str, list[Elision]]:
+    """
+    Replace inline data arrays of more than `max_rows` rows (Vega-Lite
+    `datasets` and `data.values`, Vega `data[].values`) by `sample_rows`
+    evenly spaced rows and the schema of every field with its range, mean or
+    most frequent values.
+    """
+    decoder = json.JSONDecoder()
+    replacements: list[tuple[int, int, str]] = []
+    elisions = []
+    position = 0
+    while match := _DATA_KEY_RE.search(source, position):
+        position = match.end()
+        try:
+            value, end = decoder.raw_decode(source, match.end())
+        except ValueError:
+            continue
+        if match.group(1) == "datasets" and isinstance(value, dict):
+            tables = value
+        elif match.group(1) == "values":
+            tables = {None: value}
+        else:
+            continue
+        parts = []
+        summarized = False
+        for name, rows in tables.items():
+            if (
+                isinstance(rows, list)
+                and len(rows) > max_rows
+                and all(isinstance(row, dict) for row in rows)
+            ):
+                text = _summarize_rows(rows, sample_rows)
+                summarized = True
+                label = f'dataset "{name}"' if name else "inline data values"
+                elisions.append(
+                    Elision(
+                        "summarize_inline_data",
+                        f"{len(rows) - min(sample_rows, len(rows))} of the "
+                        f"{len(rows)} rows of {label}",
+                        len(json.dumps(rows)),
+                    )
+                )
+            else:
+                text = json.dumps(rows)
+            parts.append(text if name is None else f"{json.dumps(name)}: {text}")
+        if summarized:
+            replacement = parts[0] if None in tables else "{" + ", ".join(parts) + "}"
+            replacements.append((match.end(), end, replacement))
+        position = end
+    for start, end, replacement in reversed(replacements):
+        source = source[:start] + replacement + source[end:]
+    return source, elisions
+
+
+# --- SVG geometry ------------------------------------------------------------
+
+_GEOMETRY_ATTR_RE = re.compile(r"""(\s(?:d|points)\s*=\s*)(["'])(.*?)\2""", re.S)
+
+
+def collapse_svg_paths(source: str, max_chars: int = 120) -> tuple[str, list[Elision]]:
+    """
+    Shorten SVG path `d` and polygon `points` data longer than `max_chars`
+    to their first `max_chars // 2` characters, which keep the starting point
+    and the scale of the coordinates.
+    """
+    count = 0
+    chars = 0
+
+    def replace(match: re.Match) -> str:
+        nonlocal count, chars
+        data = match.group(3)
+        if len(data) <= max_chars:
+            return match.group(0)
+        keep = max_chars // 2
+        count += 1
+        chars += len(data) - keep
+        commands = len(re.findall(r"[MLHVCSQTAZmlhvcsqtaz]", data))
+        quote = match.group(2)
+        return f"{match.group(1)}{quote}{data[:keep]}... [{commands} commands]{quote}"
+
+    source = _GEOMETRY_ATTR_RE.sub(replace, source)
+    if not count:
+        return source, []
+    return source, [
+        Elision(
+            "collapse_svg_paths",
+            f"the geometry of {count} SVG paths/polygons longer than "
+            f"{max_chars} characters",
+            chars,
+        )
+    ]
+
+
+_LEAF_MARK_RE = re.compile(
+    r"<(path|circle|rect|line|ellipse|polygon|polyline|text)\b([^>]*?)"
+    r"(?:/>|>([^<]*)</\1\s*>)",
+    re.S,
+)
+_MARK_KIND_RE = re.compile(r"""\s(class|aria-roledescription)\s*=\s*["']([^"']*)["']""")
+
+
+def collapse_repeated_marks(
+    source: str, max_run: int = 12, keep: int = 5
+) -> tuple[str, list[Elision]]:
+    """
+    Shorten runs of more than `max_run` consecutive sibling SVG elements of the
+    same kind (tag, class and ARIA role description), such as the marks of a
+    chart rendered to static SVG, to their first `keep` elements and the last.
+    """
+    runs: list[list[re.Match]] = []
+    previous = None
+    for match in _LEAF_MARK_RE.finditer(source):
+        kind = (match.group(1), tuple(_MARK_KIND_RE.findall(match.group(2))))
+        adjacent = (
+            previous is not None
+            and previous[0] == kind
+            and not source[previous[1].end() : match.start()].strip()
+        )
+        if adjacent:
+            runs[-1].append(match)
+        else:
+            runs.append([match])
+        previous = (kind, match)
+
+    replacements = []
+    elisions = []
+    for run in runs:
+        if len(run) <= max_run:
+            continue
+        start, end = run[keep - 1].end(), run[-1].start()
+        tag = run[0].group(1)
+        attrs = "".join(
+            f' {k}="{v}"' for k, v in _MARK_KIND_RE.findall(run[0].group(2))
+        )
+        omitted = len(run) - keep - 1
+        replacements.append(
+            (start, end, f"<!-- {omitted} more <{tag}{attrs}> elements -->")
+        )
+        elisions.append(
+            Elision(
+                "collapse_repeated_marks",
+                f"{omitted} of {len(run)} consecutive <{tag}{attrs}> elements",
+                end - start,
+            )
+        )
+    for start, end, replacement in reversed(replacements):
+        source = source[:start] + replacement + source[end:]
+    return source, elisions
+
+
+DEFAULT_REDUCERS: tuple[SourceReducer, ...] = (
+    strip_unused_code,
+    summarize_inline_data,
+    collapse_svg_paths,
+    collapse_repeated_marks,
+)
+
+
+def reduce_source(
+    source: str,
+    max_tokens: int | None = None,
+    reducers: tuple[SourceReducer, ...] = DEFAULT_REDUCERS,
+) -> ReducedSource:
+    """
+    Apply `reducers` in order until the source fits in `max_tokens` (as
+    estimated by `estimate_text_tokens`), then truncate it if it still does
+    not. Without a budget every reducer is applied.
+    """
+    original_tokens = estimate_text_tokens(source)
+    text = source
+    tokens = original_tokens
+    elisions: list[Elision] = []
+    for reducer in reducers:
+        if max_tokens is not None and tokens <= max_tokens:
+            break
+        text, made = reducer(text)
+        elisions += made
+        tokens = estimate_text_tokens(text)
+
+    truncated = 0
+    if max_tokens is not None and tokens > max_tokens:
+        # The estimate of a prefix grows with its length, so binary search the
+        # longest prefix within budget; token density is far from uniform.
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_text_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        truncated = len(text) - low
+        text = text[:low]
+        tokens = estimate_text_tokens(text)
+    return ReducedSource(
+        text=text,
+        original_chars=len(source),
+        original_tokens=original_tokens,
+        tokens=tokens,
+        elisions=elisions,
+        truncated_chars=truncated,
+    )
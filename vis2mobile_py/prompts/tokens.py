@@ -0,0 +1,21 @@
+import math
+import re
+
+# Words, digit runs and punctuation runs, roughly as BPE tokenizers split
+# text, with the number of characters one token typically covers for each.
+_PIECE_RE = re.compile(r"([A-Za-z]+)|(\d+)|([^\sA-Za-z\d]+)")
+_CHARS_PER_TOKEN = (6, 3, 2)
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Approximate token count of `text`, without a tokenizer: about 4
+    characters per token for English, 3 for code and JSON and less for
+    numeric data, as Gemini and OpenAI tokenizers count them. Whitespace is
+    assumed to merge into the next token.
+    """
+    tokens = 0
+    for match in _PIECE_RE.finditer(text):
+        i = match.lastindex
+        tokens += math.ceil(len(match.group(i)) / _CHARS_PER_TOKEN[i - 1])
+    return tokens
@@ -0,0 +1,83 @@
+import io
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+from PIL import Image, ImageChops, ImageStat
+
+
+@dataclass
+class BlankCheck:
+    """
+    How much of a screenshot differs from its background.
+
+    `foreground_ratio` is the share of pixels that differ from the background
+    colour (the most common corner colour) by more than the tolerance, and
+    `stddev` the standard deviation of the greyscale image.
+    """
+
+    blank: bool
+    foreground_ratio: float
+    stddev: float
+    background: tuple[int, int, int]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BlankCheck":
+        return cls(**{**data, "background": tuple(data["background"])})
+
+
+class BlankRenderError(RuntimeError):
+    """Raised when a render is still blank after every retry."""
+
+    def __init__(self, path: str, aspect_ratio: str, check: BlankCheck):
+        super().__init__(
+            f"Render of {path} in {aspect_ratio} is blank "
+            f"({check.foreground_ratio:.4%} non-background pixels)"
+        )
+        self.path = path
+        self.aspect_ratio = aspect_ratio
+        self.check = check
+
+
+def foreground_mask(
+    image: Image.Image, tolerance: int = 8
+) -> tuple[Image.Image, tuple[int, int, int]]:
+    """
+    Mask (mode "L", 255 = foreground) of the pixels of an RGB `image` that differ
+    from its background colour, taken as the most common corner colour.
+    """
+    width, height = image.size
+    corners = [(0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1)]
+    background = Counter(image.getpixel(xy) for xy in corners).most_common(1)[0][0]
+
+    difference = ImageChops.difference(image, Image.new("RGB", image.size, background))
+    # The largest channel difference decides whether a pixel is foreground.
+    red, green, blue = difference.split()
+    largest = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    mask = largest.point([0] * (tolerance + 1) + [255] * (255 - tolerance))
+    return mask, background
+
+
+def check_blank(
+    png: bytes, min_foreground_ratio: float = 0.002, tolerance: int = 8
+) -> BlankCheck:
+    """
+    Detect near-blank screenshots.
+
+    All per-pixel work runs in PIL's C routines (`ImageChops`, a lookup-table
+    `point`, `histogram` and `ImageStat`); checking a 1920x1080 screenshot is
+    dominated by decoding the PNG.
+    """
+    image = Image.open(io.BytesIO(png)).convert("RGB")
+    mask, background = foreground_mask(image, tolerance)
+    width, height = image.size
+    foreground_ratio = mask.histogram()[255] / (width * height)
+
+    return BlankCheck(
+        blank=foreground_ratio < min_foreground_ratio,
+        foreground_ratio=foreground_ratio,
+        stddev=ImageStat.Stat(image.convert("L")).stddev[0],
+        background=background,
+    )
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+# Bump whenever a change to the render pipeline changes the produced pixels
+# or the recorded metadata, so that stale cache entries are never served.
+RENDERER_VERSION = "7"
+
+# Attribute values and CSS `url(...)` references that may point at local files.
+# Vega specs reference data with `"url": "..."`, which is matched as well.
+_ASSET_REF_RE = re.compile(
+    r"""(?:\b(?:src|href|xlink:href)\s*=\s*["']([^"']+)["'])"""
+    r"""|(?:url\(\s*["']?([^"')]+)["']?\s*\))"""
+    r"""|(?:"url"\s*:\s*"([^"]+)")"""
+)
+
+# (path, mtime_ns, size) -> sha256 hex digest
+_file_digests: dict[tuple[str, int, int], str] = {}
+
+
+def _playwright_version() -> str:
+    try:
+        return version("playwright")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def default_cache_dir() -> Path:
+    if "VIS2MOBILE_CACHE_DIR" in os.environ:
+        return Path(os.environ["VIS2MOBILE_CACHE_DIR"])
+    xdg_cache = os.getenv("XDG_CACHE_HOME", str(Path.home() / ".cache"))
+    return Path(xdg_cache) / "vis2mobile"
+
+
+def file_digest(path: Path) -> str:
+    stat = path.stat()
+    memo_key = (str(path), stat.st_mtime_ns, stat.st_size)
+    digest = _file_digests.get(memo_key)
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        _file_digests[memo_key] = digest
+    return digest
+
+
+def referenced_local_assets(path: Path) -> list[Path]:
+    """Local files referenced by an HTML/SVG document, e.g. `../assets/vega.min.js`."""
+    text = path.read_text(errors="replace")
+    assets = set()
+    for match in _ASSET_REF_RE.finditer(text):
+        ref = next(group for group in match.groups() if group)
+        parts = urlsplit(ref)
+        if parts.scheme == "file":
+            candidate = Path(unquote(parts.path))
+        elif parts.scheme or ref.startswith(("#", "//")) or not parts.path:
+            # Remote, data: and in-document references do not live on disk.
+            continue
+        else:
+            candidate = path.parent / unquote(parts.path)
+        candidate = candidate.resolve()
+        if candidate.is_file() and candidate != path:
+            assets.add(candidate)
+    return sorted(assets)
+
+
+def render_cache_key(path: str | Path, viewport: dict[str, int], **options) -> str:
+    """
+    Content address of a render.
+
+    The key covers the bytes of the document and every local asset it
+    references, the viewport, any extra render `options` (which must be JSON
+    serializable) and the renderer and Playwright versions. Editing the HTML or
+    one of its assets therefore yields a new key, while moving it does not.
+    """
+    path = Path(path).resolve()
+    material = {
+        "renderer_version": RENDERER_VERSION,
+        "playwright": _playwright_version(),
+        "document": file_digest(path),
+        "assets": [file_digest(asset) for asset in referenced_local_assets(path)],
+        "viewport": viewport,
+        "options": options,
+    }
+    encoded = json.dumps(material, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def atomic_write(target: Path, data: bytes) -> Path:
+    """
+    Write `data` to a temporary file next to `target` and move it into place,
+    so concurrent readers never see a partially written file.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_name, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+    return target
+
+
+class RenderCache:
+    """
+    On-disk cache of rendered PNGs shared by every process on the machine.
+
+    Entries are `<key[:2]>/<key>.png` with an optional `<key>.json` metadata
+    sidecar. Writes go to a temporary file in the same directory and are moved
+    into place with `os.replace`, so concurrent writers never expose a partially
+    written file and the last identical write wins.
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root is not None else default_cache_dir() / "renders"
+
+    def _entry(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def png_path(self, key: str) -> Path:
+        return self._entry(key, ".png")
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            return self.png_path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def get_metadata(self, key: str) -> dict | None:
+        try:
+            return json.loads(self._entry(key, ".json").read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, png: bytes, metadata: dict | None = None) -> Path:
+        # The metadata goes first so that a visible PNG always has its sidecar.
+        if metadata is not None:
+            atomic_write(self._entry(key, ".json"), json.dumps(metadata).encode())
+        return atomic_write(self.png_path(key), png)
+
+    def get_artifact(self, key: str, name: str) -> bytes | None:
+        """Extra output stored next to a render, e.g. its exported Vega data."""
+        try:
+            return self._entry(key, f".{name}").read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put_artifact(self, key: str, name: str, data: bytes) -> Path:
+        return atomic_write(self._entry(key, f".{name}"), data)
+
+
+_default_cache: RenderCache | None = None
+
+
+def get_render_cache() -> RenderCache | None:
+    """
+    Process-wide render cache, or `None` if disabled via `VIS2MOBILE_RENDER_CACHE=0`.
+    """
+    global _default_cache
+    if os.getenv("VIS2MOBILE_RENDER_CACHE", "1") == "0":
+        return None
+    if _default_cache is None:
+        _default_cache = RenderCache()
+    return _default_cache
@@ -0,0 +1,128 @@
+from playwright.async_api import Page
+
+from vis2mobile_py.render.options import RenderOptions
+
+# Page-coordinate box of the element matching `selector`, or null.
+_ELEMENT_BOX = """
+(selector) => {
+  const element = document.querySelector(selector);
+  if (!element) return null;
+  const rect = element.getBoundingClientRect();
+  if (rect.width === 0 || rect.height === 0) return null;
+  return {
+    x: rect.left + window.scrollX,
+    y: rect.top + window.scrollY,
+    width: rect.width,
+    height: rect.height,
+  };
+}
+"""
+
+# Page-coordinate union of the boxes of visible text, images, canvases and SVG
+# roots. Containers are not measured themselves since block elements span the
+# full width of the page regardless of their content.
+_CONTENT_BOX = """
+() => {
+  if (!document.body) {
+    // Standalone SVG documents have no body, their root is the content.
+    const rect = document.documentElement.getBoundingClientRect();
+    return { x: rect.left, y: rect.top, width: rect.width, height: rect.height };
+  }
+  let left = Infinity, top = Infinity, right = -Infinity, bottom = -Infinity;
+  const add = (rect) => {
+    if (rect.width === 0 || rect.height === 0) return;
+    left = Math.min(left, rect.left);
+    top = Math.min(top, rect.top);
+    right = Math.max(right, rect.right);
+    bottom = Math.max(bottom, rect.bottom);
+  };
+  const visible = (element) =>
+    element.checkVisibility({ opacityProperty: true, visibilityProperty: true });
+  // Nodes inside an SVG are rejected with their subtrees, the SVG root
+  // already bounds them.
+  const walker = document.createTreeWalker(
+    document.body,
+    NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT,
+    (node) =>
+      node.parentElement && node.parentElement.closest("svg")
+        ? NodeFilter.FILTER_REJECT
+        : NodeFilter.FILTER_ACCEPT,
+  );
+  for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+    if (node.nodeType === Node.TEXT_NODE) {
+      if (!node.textContent.trim() || !visible(node.parentElement)) continue;
+      const range = document.createRange();
+      range.selectNodeContents(node);
+      add(range.getBoundingClientRect());
+    } else if (node.matches("svg, canvas, img, video, iframe") && visible(node)) {
+      add(node.getBoundingClientRect());
+    }
+  }
+  if (left === Infinity) return null;
+  return {
+    x: left + window.scrollX,
+    y: top + window.scrollY,
+    width: right - left,
+    height: bottom - top,
+  };
+}
+"""
+
+_PAGE_SIZE = """
+() => ({
+  width: document.documentElement.scrollWidth,
+  height: document.documentElement.scrollHeight,
+})
+"""
+
+
+async def take_screenshot(
+    page: Page, options: RenderOptions, padding: int = 8
+) -> tuple[bytes, str]:
+    """
+    Capture `page` according to `options.capture`.
+
+    Returns the PNG bytes and the capture mode actually used, which is
+    `content` when `element` found no element matching the selector.
+    """
+    # Finite animations left running are fast-forwarded to their end.
+    animations = "disabled" if options.deterministic else "allow"
+    if options.capture == "viewport":
+        return await page.screenshot(type="png", animations=animations), "viewport"
+
+    page_size = await page.evaluate(_PAGE_SIZE)
+    capture = options.capture
+    box = None
+    if capture == "element":
+        box = await page.evaluate(_ELEMENT_BOX, options.selector)
+        if box is None:
+            capture = "content"
+    if capture == "content":
+        box = await page.evaluate(_CONTENT_BOX)
+    if box is None:
+        box = {"x": 0, "y": 0, **page_size}
+    else:
+        box = {
+            "x": box["x"] - padding,
+            "y": box["y"] - padding,
+            "width": box["width"] + 2 * padding,
+            "height": box["height"] + 2 * padding,
+        }
+
+    # Clamp to the page and to `max_height`.
+    x = max(box["x"], 0)
+    y = max(box["y"], 0)
+    clip = {
+        "x": x,
+        "y": y,
+        "width": max(min(box["x"] + box["width"], page_size["width"]) - x, 1),
+        "height": max(
+            min(box["y"] + box["height"], page_size["height"], y + options.max_height)
+            - y,
+            1,
+        ),
+    }
+    png = await page.screenshot(
+        type="png", full_page=True, clip=clip, animations=animations
+    )
+    return png, capture
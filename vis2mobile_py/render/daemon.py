@@ -0,0 +1,252 @@
+"""
+Local render daemon shared by many short-lived processes.
+
+    python -m vis2mobile_py.render.daemon --socket /tmp/vis2mobile-render.sock
+
+keeps a warm render pool (and the render cache) in one process and serves
+renders over a Unix domain socket. With `VIS2MOBILE_RENDER_SOCKET` pointing at
+the socket, `html_to_image`/`html_to_images` in any other process send their
+renders to the daemon instead of launching Chromium themselves.
+
+Each request is one JSON line. The response is one JSON line followed by the
+PNG bytes of every result, in order, with their lengths given in the JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+from dataclasses import asdict
+from pathlib import Path
+
+from vis2mobile_py.render.blank import BlankCheck, BlankRenderError
+from vis2mobile_py.render.options import RenderOptions
+from vis2mobile_py.render.pool import RenderPool
+from vis2mobile_py.render.result import RenderResult
+
+logger = logging.getLogger(__name__)
+
+# Requests are small; this only bounds a misbehaving client.
+_MAX_REQUEST_BYTES = 1024 * 1024
+# Response headers carry render logs, which can be long; the daemon is trusted.
+_MAX_RESPONSE_HEADER_BYTES = 64 * 1024 * 1024
+
+
+class RenderDaemonError(RuntimeError):
+    """A render failed inside the daemon for a reason other than a blank page."""
+
+
+def get_render_socket() -> str | None:
+    return os.getenv("VIS2MOBILE_RENDER_SOCKET") or None
+
+
+async def render_via_daemon(
+    socket_path: str | Path,
+    path: str | Path,
+    aspect_ratios: tuple[str, ...],
+    on_blank: str = "raise",
+    max_attempts: int = 3,
+    options: RenderOptions | None = None,
+    exports: tuple[str, ...] = (),
+) -> dict[str, RenderResult]:
+    """
+    Render `path` in the daemon listening on `socket_path`.
+
+    Raises `ConnectionError`/`FileNotFoundError` if the daemon is not running,
+    `BlankRenderError` like a local render and `RenderDaemonError` for any other
+    failure inside the daemon.
+    """
+    request = {
+        "path": str(Path(path).resolve()),
+        "ratios": list(aspect_ratios),
+        "on_blank": on_blank,
+        "max_attempts": max_attempts,
+        "options": asdict(options or RenderOptions()),
+        "exports": list(exports),
+    }
+    reader, writer = await asyncio.open_unix_connection(
+        str(socket_path), limit=_MAX_RESPONSE_HEADER_BYTES
+    )
+    try:
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        if not response["ok"]:
+            if response["error"] == "BlankRenderError":
+                raise BlankRenderError(
+                    response["path"],
+                    response["aspect_ratio"],
+                    BlankCheck.from_dict(response["blank_check"]),
+                )
+            raise RenderDaemonError(f"{response['error']}: {response['message']}")
+        results = {}
+        for entry in response["results"]:
+            png = await reader.readexactly(entry["png_bytes"])
+            result = RenderResult.from_metadata(
+                png, entry["metadata"], cache_hit=entry["cache_hit"]
+            )
+            result.timings = entry["timings"]
+            for name, size in entry["export_bytes"].items():
+                setattr(result, name, json.loads(await reader.readexactly(size)))
+            results[result.aspect_ratio] = result
+        return results
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+class RenderDaemon:
+    """Serves renders from one `RenderPool` to clients on a Unix socket."""
+
+    def __init__(self, socket_path: str | Path, pool: RenderPool | None = None):
+        self.socket_path = Path(socket_path)
+        self.pool = pool or RenderPool()
+
+    async def serve_forever(self) -> None:
+        self._remove_stale_socket()
+        await self.pool.start()
+        server = await asyncio.start_unix_server(
+            self._handle, path=str(self.socket_path), limit=_MAX_REQUEST_BYTES
+        )
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        logger.info(
+            "Render daemon listening on %s with %d pages",
+            self.socket_path,
+            self.pool.size,
+        )
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            logger.info("Render pool stats: %s", self.pool.stats().to_dict())
+            await self.pool.stop()
+            self.socket_path.unlink(missing_ok=True)
+
+    def _remove_stale_socket(self) -> None:
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except ConnectionRefusedError:
+            # Left behind by a daemon that did not shut down cleanly.
+            self.socket_path.unlink()
+        else:
+            raise RuntimeError(
+                f"A render daemon is already listening on {self.socket_path}"
+            )
+        finally:
+            probe.close()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                header, payloads = await self._render(request)
+                writer.write(json.dumps(header).encode() + b"\n")
+                for payload in payloads:
+                    writer.write(payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError:
+            logger.warning("Dropped a client that sent a malformed request")
+        finally:
+            writer.close()
+
+    async def _render(self, request: dict) -> tuple[dict, list[bytes]]:
+        # Imported here, `vis2mobile_py.utils` itself imports this module.
+        from vis2mobile_py.utils import html_to_images
+
+        try:
+            results = await html_to_images(
+                request["path"],
+                request["ratios"],
+                return_type="result",
+                pool=self.pool,
+                on_blank=request["on_blank"],
+                max_attempts=request["max_attempts"],
+                options=RenderOptions(**request["options"]),
+                vega_data="vega_data" in request.get("exports", ()),
+                scene="scene" in request.get("exports", ()),
+            )
+        except BlankRenderError as e:
+            return {
+                "ok": False,
+                "error": "BlankRenderError",
+                "path": e.path,
+                "aspect_ratio": e.aspect_ratio,
+                "blank_check": e.check.to_dict(),
+            }, []
+        except Exception as e:
+            logger.exception("Render of %s failed", request.get("path"))
+            return {"ok": False, "error": type(e).__name__, "message": str(e)}, []
+
+        # Exports can be megabytes of Vega datasets, so like the PNGs they
+        # follow the header as length-prefixed payloads rather than inside it.
+        entries, payloads = [], []
+        for result in results.values():
+            exports = {
+                name: json.dumps(getattr(result, name)).encode()
+                for name in request.get("exports", ())
+            }
+            entries.append(
+                {
+                    "metadata": result.metadata(),
+                    "cache_hit": result.cache_hit,
+                    "timings": result.timings,
+                    "png_bytes": len(result.png),
+                    "export_bytes": {name: len(data) for name, data in exports.items()},
+                }
+            )
+            payloads += [result.png, *exports.values()]
+        return {"ok": True, "results": entries}, payloads
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m vis2mobile_py.render.daemon")
+    parser.add_argument(
+        "--socket",
+        default=get_render_socket(),
+        required=get_render_socket() is None,
+        help="Socket path, defaults to $VIS2MOBILE_RENDER_SOCKET",
+    )
+    parser.add_argument("--browsers", type=int, default=1)
+    parser.add_argument("--contexts", type=int, default=8, help="Contexts per browser")
+    parser.add_argument(
+        "--max-renders",
+        type=int,
+        default=500,
+        help="Recycle a context after this many renders, 0 to never recycle",
+    )
+    parser.add_argument(
+        "--max-rss-mb",
+        type=int,
+        default=None,
+        help="Relaunch a browser once its processes use more resident memory",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    daemon = RenderDaemon(
+        args.socket,
+        RenderPool(
+            browsers=args.browsers,
+            contexts_per_browser=args.contexts,
+            max_renders_per_context=args.max_renders or None,
+            max_browser_rss_bytes=args.max_rss_mb * 2**20 if args.max_rss_mb else None,
+        ),
+    )
+    asyncio.run(daemon.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import json
+
+# 2024-01-01T00:00:00Z, the time every deterministic render believes it is.
+FROZEN_TIME_MS = 1704067200000
+RANDOM_SEED = 20240101
+
+# Animations finish at once instead of being captured midway. Playwright's
+# `animations="disabled"` does the same for the screenshot itself, this also
+# covers the layout the readiness engine waits on.
+_NO_MOTION_CSS = """
+*, *::before, *::after {
+  animation-delay: 0s !important;
+  animation-duration: 0s !important;
+  animation-iteration-count: 1 !important;
+  transition-delay: 0s !important;
+  transition-duration: 0s !important;
+  caret-color: transparent !important;
+  scroll-behavior: auto !important;
+}
+"""
+
+# Installed before the page's scripts. `Date.now()` and `new Date()` start at
+# a fixed instant and advance by one millisecond per read, so code that waits
+# for time to pass (`while (Date.now() < end)`) still terminates, the same
+# way on every run. `performance.now()` and animation-frame timestamps are
+# left alone: the readiness engine relies on them.
+_DETERMINISTIC_SCRIPT = """
+((config) => {
+  // mulberry32
+  let seed = config.seed >>> 0;
+  Math.random = () => {
+    seed = (seed + 0x6d2b79f5) >>> 0;
+    let t = seed;
+    t = Math.imul(t ^ (t >>> 15), t | 1);
+    t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+
+  const RealDate = Date;
+  let now = config.now;
+  const tick = () => now++;
+  function FrozenDate(...args) {
+    if (!new.target) return new RealDate(tick()).toString();
+    return args.length ? new RealDate(...args) : new RealDate(tick());
+  }
+  FrozenDate.prototype = RealDate.prototype;
+  FrozenDate.prototype.constructor = FrozenDate;
+  FrozenDate.now = tick;
+  FrozenDate.parse = RealDate.parse;
+  FrozenDate.UTC = RealDate.UTC;
+  window.Date = FrozenDate;
+
+  const animate = Element.prototype.animate;
+  Element.prototype.animate = function (keyframes, options) {
+    const timing = typeof options === "number" ? {} : Object.assign({}, options);
+    timing.duration = 0;
+    timing.delay = 0;
+    timing.iterations = 1;
+    return animate.call(this, keyframes, timing);
+  };
+
+  const style = document.createElement("style");
+  style.textContent = config.css;
+  const install = () => {
+    const root = document.head || document.documentElement;
+    if (!root) return false;
+    root.appendChild(style);
+    return true;
+  };
+  if (!install()) {
+    const observer = new MutationObserver(() => install() && observer.disconnect());
+    observer.observe(document, { childList: true, subtree: true });
+  }
+})(%s);
+"""
+
+
+def deterministic_script(seed: int = RANDOM_SEED, now_ms: int = FROZEN_TIME_MS) -> str:
+    """
+    Init script making a page render identically on every run: `Math.random`
+    is seeded, the clock starts at `now_ms`, and CSS animations, transitions
+    and Web Animations complete immediately.
+    """
+    config = {"seed": seed, "now": now_ms, "css": _NO_MOTION_CSS}
+    return _DETERMINISTIC_SCRIPT % json.dumps(config)
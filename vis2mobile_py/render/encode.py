@@ -0,0 +1,138 @@
+import base64
+import io
+from dataclasses import dataclass
+from typing import Literal
+
+from PIL import Image
+
+from vis2mobile_py.render.blank import foreground_mask
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+@dataclass(frozen=True)
+class ImageBudget:
+    """
+    Limits for an image sent to a model.
+
+    The image is first cropped to its content (`autocrop`) and scaled down to
+    at most `max_pixels`, then encoded as `format`. If it is still larger than
+    `max_bytes`, the quality is lowered in steps down to `min_quality` and
+    after that the image is scaled down further until it fits.
+    """
+
+    max_bytes: int | None = None
+    max_pixels: int | None = None
+    format: Literal["webp", "jpeg", "png"] = "webp"
+    quality: int = 85
+    min_quality: int = 50
+    autocrop: bool = False
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    original_bytes: int
+    quality: int | None
+
+    @property
+    def encoded_bytes(self) -> int:
+        return len(self.data)
+
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64()}"
+
+    def metadata(self) -> dict:
+        return {
+            "mime_type": self.mime_type,
+            "original_size": [self.original_width, self.original_height],
+            "encoded_size": [self.width, self.height],
+            "original_bytes": self.original_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "quality": self.quality,
+        }
+
+
+def autocrop(image: Image.Image, padding: int = 16, tolerance: int = 8) -> Image.Image:
+    """Crop uniform background margins, keeping `padding` pixels around the content."""
+    mask, _ = foreground_mask(image.convert("RGB"), tolerance)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop(
+        (
+            max(left - padding, 0),
+            max(top - padding, 0),
+            min(right + padding, image.width),
+            min(bottom + padding, image.height),
+        )
+    )
+
+
+def _encode(image: Image.Image, format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if format == "png":
+        image.save(buffer, format="PNG", optimize=True)
+    elif format == "jpeg":
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def _scaled(image: Image.Image, factor: float) -> Image.Image:
+    size = (max(round(image.width * factor), 1), max(round(image.height * factor), 1))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def encode_image(png: bytes, budget: ImageBudget | None = None) -> EncodedImage:
+    """
+    Encode a rendered PNG within `budget`. Without a budget the PNG bytes are
+    passed through as they are; only the header is read for its size.
+    """
+    if budget is None:
+        with Image.open(io.BytesIO(png)) as original:
+            width, height = original.size
+        return EncodedImage(
+            png, "image/png", width, height, width, height, len(png), None
+        )
+
+    original = Image.open(io.BytesIO(png))
+    image = original.convert("RGB")
+    if budget.autocrop:
+        image = autocrop(image)
+    if budget.max_pixels and image.width * image.height > budget.max_pixels:
+        image = _scaled(
+            image, (budget.max_pixels / (image.width * image.height)) ** 0.5
+        )
+
+    quality = budget.quality
+    data = _encode(image, budget.format, quality)
+    while budget.max_bytes and len(data) > budget.max_bytes:
+        if budget.format != "png" and quality > budget.min_quality:
+            quality = max(quality - 10, budget.min_quality)
+        elif image.width > 1 or image.height > 1:
+            image = _scaled(image, 0.75)
+        else:
+            break
+        data = _encode(image, budget.format, quality)
+
+    return EncodedImage(
+        data=data,
+        mime_type=MIME_TYPES[budget.format],
+        width=image.width,
+        height=image.height,
+        original_width=original.width,
+        original_height=original.height,
+        original_bytes=len(png),
+        quality=quality if budget.format != "png" else None,
+    )
@@ -0,0 +1,281 @@
+"""
+Structured per-render events.
+
+Every render (including cache hits) emits one `RenderEvent` per aspect ratio to
+the hooks registered with `add_render_hook`. Setting `VIS2MOBILE_RENDER_EVENTS`
+to a file path appends every event to it as JSON lines, which can then be
+summarized with
+
+    python -m vis2mobile_py.render.events report events.jsonl
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Phases in the order they happen during a render.
+PHASES = [
+    "cache_lookup",
+    "acquire",
+    "goto",
+    "resize",
+    "wait",
+    "screenshot",
+    "decode",
+    "vega_data",
+    "scene",
+    "cache_write",
+]
+
+
+@dataclass
+class RenderEvent:
+    """
+    What one render of one aspect ratio cost.
+
+    `phases` maps phase names (see `PHASES`) to milliseconds. `acquire` (which
+    includes launching Chromium when the pool is cold) and `goto` are paid once
+    per page load and are recorded on the first ratio rendered from it.
+    `decode` is the time spent decoding the PNG for the blank check.
+    """
+
+    path: str
+    aspect_ratio: str
+    cache_hit: bool
+    phases: dict[str, float] = field(default_factory=dict)
+    output_bytes: int = 0
+    strategy: str | None = None
+    attempts: int = 1
+    blank: bool = False
+    chromium_rss_bytes: int | None = None
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class PhaseTimer:
+    """Accumulates wall-clock milliseconds per phase."""
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+
+class JsonlSink:
+    """Render hook that appends every event to `path` as one JSON line."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def __call__(self, event: RenderEvent) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            f.write(json.dumps(event.to_dict()) + "\n")
+
+
+RenderHook = Callable[[RenderEvent], None]
+
+_hooks: list[RenderHook] = []
+_env_sink_installed = False
+
+
+def _install_env_sink() -> None:
+    global _env_sink_installed
+    if _env_sink_installed:
+        return
+    _env_sink_installed = True
+    path = os.getenv("VIS2MOBILE_RENDER_EVENTS")
+    if path:
+        _hooks.append(JsonlSink(path))
+
+
+def add_render_hook(hook: RenderHook) -> None:
+    _install_env_sink()
+    _hooks.append(hook)
+
+
+def remove_render_hook(hook: RenderHook) -> None:
+    _hooks.remove(hook)
+
+
+def has_render_hooks() -> bool:
+    """Whether anything listens, so callers can skip collecting event data."""
+    _install_env_sink()
+    return bool(_hooks)
+
+
+def emit(event: RenderEvent) -> None:
+    _install_env_sink()
+    for hook in list(_hooks):
+        try:
+            hook(event)
+        except Exception:
+            # Instrumentation must never fail a render.
+            logger.exception("Render hook %r failed", hook)
+
+
+def rss_bytes(pids: Iterable[int]) -> int | None:
+    """
+    Resident memory of the processes `pids`, summed. Processes that exited in
+    the meantime are skipped. `None` where `/proc` is unavailable.
+    """
+    proc = Path("/proc")
+    if not (proc / "self" / "statm").exists():
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in pids:
+        try:
+            resident = int((proc / str(pid) / "statm").read_text().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        total += resident * page_size
+    return total
+
+
+def chromium_rss_bytes() -> int | None:
+    """
+    Resident memory of all Chromium processes started by this process, summed
+    over the descendants found in `/proc`. `None` where `/proc` is unavailable.
+    """
+    proc = Path("/proc")
+    if not (proc / "self" / "stat").exists():
+        return None
+    children: dict[int, list[int]] = {}
+    names: dict[int, str] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name is parenthesized and may itself contain spaces.
+        name = stat[stat.index("(") + 1 : stat.rindex(")")]
+        ppid = int(stat[stat.rindex(")") + 2 :].split()[1])
+        pid = int(entry.name)
+        names[pid] = name
+        children.setdefault(ppid, []).append(pid)
+
+    chromium = []
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        if names[pid].startswith(("chrom", "headless")):
+            chromium.append(pid)
+    return rss_bytes(chromium)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of a non-empty list.
+
+    >>> _percentile([1, 2], 50), _percentile(list(range(1, 11)), 50)
+    (1, 5)
+    >>> _percentile(list(range(1, 21)), 95), _percentile([3], 95)
+    (19, 3)
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def load_events(paths: list[str | Path]) -> list[dict]:
+    events = []
+    for path in paths:
+        with open(path) as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+    return events
+
+
+def report(events: list[dict]) -> str:
+    """Summarize events as p50/p95 per phase plus cache and memory figures."""
+    lines = []
+    hits = sum(1 for e in events if e["cache_hit"])
+    lines.append(
+        f"{len(events)} renders, {hits} cache hits, "
+        f"{sum(1 for e in events if e['blank'])} blank"
+    )
+    lines.append("")
+    lines.append(
+        f"{'phase':<14}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'total s':>12}"
+    )
+    phases = PHASES + sorted({p for e in events for p in e["phases"]} - set(PHASES))
+    for phase in phases:
+        values = [e["phases"][phase] for e in events if phase in e["phases"]]
+        if not values:
+            continue
+        lines.append(
+            f"{phase:<14}{len(values):>8}{_percentile(values, 50):>12.1f}"
+            f"{_percentile(values, 95):>12.1f}{sum(values) / 1000:>12.2f}"
+        )
+    totals = [sum(e["phases"].values()) for e in events]
+    if totals:
+        lines.append(
+            f"{'(all)':<14}{len(totals):>8}{_percentile(totals, 50):>12.1f}"
+            f"{_percentile(totals, 95):>12.1f}{sum(totals) / 1000:>12.2f}"
+        )
+
+    output_bytes = [e["output_bytes"] for e in events]
+    if output_bytes:
+        lines.append("")
+        lines.append(
+            f"output bytes: p50 {_percentile(output_bytes, 50):.0f}, "
+            f"p95 {_percentile(output_bytes, 95):.0f}"
+        )
+    rss = [e["chromium_rss_bytes"] for e in events if e["chromium_rss_bytes"]]
+    if rss:
+        lines.append(
+            f"chromium rss MB: p50 {_percentile(rss, 50) / 2**20:.0f}, "
+            f"p95 {_percentile(rss, 95) / 2**20:.0f}, max {max(rss) / 2**20:.0f}"
+        )
+    strategies: dict[str, int] = {}
+    for e in events:
+        if not e["cache_hit"]:
+            key = e["strategy"] or "none"
+            strategies[key] = strategies.get(key, 0) + 1
+    if strategies:
+        counts = ", ".join(
+            f"{name} {count}"
+            for name, count in sorted(strategies.items(), key=lambda x: -x[1])
+        )
+        lines.append(f"gating strategy: {counts}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m vis2mobile_py.render.events")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser(
+        "report", help="Summarize render events as p50/p95 per phase"
+    )
+    report_parser.add_argument("files", nargs="+", type=Path, help="JSONL event files")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        print(report(load_events(args.files)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import copy
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from playwright.async_api import ConsoleMessage, Error, Page, Request, Response
+
+
+@dataclass
+class RenderLog:
+    """
+    Errors a page reported while it was rendered: `console.error` messages,
+    uncaught exceptions (`pageerror`) and requests that failed or returned an
+    HTTP error, e.g. a dataset missing from disk or from the data mirror.
+    """
+
+    console_errors: list[dict] = field(default_factory=list)
+    page_errors: list[dict] = field(default_factory=list)
+    failed_requests: list[dict] = field(default_factory=list)
+
+    @property
+    def has_errors(self) -> bool:
+        return bool(self.console_errors or self.page_errors or self.failed_requests)
+
+    def summary(self) -> str:
+        lines = [f"pageerror: {e['message']}" for e in self.page_errors]
+        lines += [f"console.error: {e['text']}" for e in self.console_errors]
+        lines += [
+            f"request failed: {r['url']} ({r['failure']})" for r in self.failed_requests
+        ]
+        return "\n".join(lines)
+
+    def snapshot(self) -> "RenderLog":
+        return copy.deepcopy(self)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RenderLog":
+        return cls(**data)
+
+
+class RenderLogRecorder:
+    """Records the errors of `page` into a `RenderLog` between attach and detach."""
+
+    def __init__(self, page: Page):
+        self.page = page
+        self.log = RenderLog()
+
+    def attach(self) -> RenderLog:
+        self.page.on("console", self._on_console)
+        self.page.on("pageerror", self._on_page_error)
+        self.page.on("requestfailed", self._on_request_failed)
+        self.page.on("response", self._on_response)
+        return self.log
+
+    def detach(self) -> None:
+        self.page.remove_listener("console", self._on_console)
+        self.page.remove_listener("pageerror", self._on_page_error)
+        self.page.remove_listener("requestfailed", self._on_request_failed)
+        self.page.remove_listener("response", self._on_response)
+
+    def _on_console(self, message: ConsoleMessage) -> None:
+        if message.type == "error":
+            self.log.console_errors.append(
+                {"text": message.text, "location": message.location}
+            )
+
+    def _on_page_error(self, error: Error) -> None:
+        self.log.page_errors.append({"message": error.message, "stack": error.stack})
+
+    def _on_request_failed(self, request: Request) -> None:
+        self.log.failed_requests.append(
+            {"url": request.url, "failure": request.failure or "failed"}
+        )
+
+    def _on_response(self, response: Response) -> None:
+        # Browsers request a favicon on their own; pages do not depend on it.
+        if response.status >= 400 and not response.url.endswith("/favicon.ico"):
+            self.log.failed_requests.append(
+                {"url": response.url, "failure": f"HTTP {response.status}"}
+            )
+
+
+def save_render_log(logs: dict[str, RenderLog | None], path: str | Path) -> str:
+    """
+    Write the log of each aspect ratio to `path` as JSON (`render-log.json` in
+    a project's `original_visualization`).
+
+    Returns a summary of the errors, with the ones shared by several ratios
+    listed once, or an empty string if every render was clean.
+    """
+    Path(path).write_text(
+        json.dumps(
+            {ratio: log.to_dict() if log else None for ratio, log in logs.items()},
+            indent=2,
+        )
+    )
+    lines = []
+    for log in logs.values():
+        if log is not None:
+            lines.extend(log.summary().splitlines())
+    return "\n".join(dict.fromkeys(lines))
@@ -0,0 +1,70 @@
+from dataclasses import asdict, dataclass
+from typing import Literal
+
+from vis2mobile_py.render.deterministic import deterministic_script
+from vis2mobile_py.render.vega import VegaRenderer, embed_renderer_script
+
+CaptureMode = Literal["viewport", "element", "content", "full_page"]
+
+
+@dataclass(frozen=True)
+class RenderOptions:
+    """
+    Settings that change the pixels of a render, and are therefore part of its
+    cache key.
+
+    `capture` selects what is captured:
+
+    - `viewport`: the visible viewport, as before.
+    - `element`: the element matching `selector` (e.g. `#vis`), even where it
+      extends past the viewport. Falls back to `content` if nothing matches.
+    - `content`: the bounding box of all visible text, images, canvases and
+      SVGs on the page.
+    - `full_page`: the whole scrollable page.
+
+    Captures other than `viewport` are at most `max_height` pixels tall.
+
+    `vega_renderer` picks the vega-embed renderer: `svg`, `canvas`, or `auto`,
+    which uses SVG for specs with inline data and fewer than an estimated
+    `canvas_threshold` marks, and canvas otherwise, e.g. for data loaded from
+    a URL (see `vis2mobile_py.render.vega`).
+
+    `deterministic` renders identical inputs to byte-identical PNGs: the page
+    prefers reduced motion, CSS animations and transitions complete at once,
+    the clock is fixed and `Math.random` is seeded (see
+    `vis2mobile_py.render.deterministic`). Turn it off to see a page as it
+    behaves live, e.g. one that shows the current date.
+    """
+
+    capture: CaptureMode = "viewport"
+    selector: str = "#vis"
+    max_height: int = 10000
+    vega_renderer: VegaRenderer = "auto"
+    canvas_threshold: int = 1000
+    deterministic: bool = True
+
+    def __post_init__(self):
+        assert self.capture in ["viewport", "element", "content", "full_page"], (
+            f"Invalid capture mode: {self.capture}"
+        )
+        assert self.max_height > 0, f"max_height must be positive: {self.max_height}"
+        assert self.vega_renderer in ["auto", "svg", "canvas"], (
+            f"Invalid vega renderer: {self.vega_renderer}"
+        )
+
+    @property
+    def init_scripts(self) -> tuple[str, ...]:
+        scripts = (embed_renderer_script(self.vega_renderer, self.canvas_threshold),)
+        if self.deterministic:
+            scripts = (deterministic_script(),) + scripts
+        return scripts
+
+    def cache_key_options(self) -> dict:
+        options = asdict(self)
+        if self.capture != "element":
+            del options["selector"]
+        if self.capture == "viewport":
+            del options["max_height"]
+        if self.vega_renderer != "auto":
+            del options["canvas_threshold"]
+        return options
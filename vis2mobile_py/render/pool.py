@@ -0,0 +1,428 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator
+
+from playwright.async_api import (
+    Browser,
+    BrowserContext,
+    CDPSession,
+    Page,
+    Playwright,
+    async_playwright,
+)
+
+from vis2mobile_py.render.events import rss_bytes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PooledBrowser:
+    browser: Browser
+    contexts: int = 0
+    renders: int = 0
+    rss_bytes: int | None = None
+    retired: bool = False
+    # Launched when the first context of a retired browser is replaced.
+    replacement: "_PooledBrowser | None" = None
+    cdp: CDPSession | None = None
+
+
+@dataclass
+class _PooledContext:
+    browser: _PooledBrowser
+    context: BrowserContext
+    live_pages: int = 0
+    renders: int = 0
+    # Retired contexts take no new pages and are replaced once drained.
+    retired: bool = False
+
+
+@dataclass
+class _PooledPage:
+    page: Page
+    owner: _PooledContext
+    init_scripts: tuple[str, ...]
+    cdp: CDPSession | None = None
+
+
+@dataclass
+class PoolStats:
+    """
+    Counters of a `RenderPool` since it was created.
+
+    Memory is sampled through CDP: the JS heap of the page after a render
+    (`Performance.getMetrics`), after every render when a heap ceiling is
+    set and every `memory_check_interval` renders otherwise, and the
+    resident memory of every process of each browser
+    (`SystemInfo.getProcessInfo`) every `memory_check_interval` renders.
+    `browser_rss_bytes` holds the latest sample of each running browser,
+    `None` where it could not be taken.
+    """
+
+    renders: int = 0
+    pages_opened: int = 0
+    pages_recycled: int = 0
+    contexts_recycled: int = 0
+    browsers_recycled: int = 0
+    peak_page_heap_bytes: int = 0
+    peak_browser_rss_bytes: int = 0
+    context_renders: list[int] = field(default_factory=list)
+    browser_rss_bytes: list[int | None] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class RenderPool:
+    """
+    Keeps headless Chromium browsers and their contexts warm across renders.
+
+    `browsers` Chromium processes are launched on `start()`, each with
+    `contexts_per_browser` browser contexts. At most one page per context is
+    rendering at a time, so the pool renders up to
+    `browsers * contexts_per_browser` pages concurrently. Pages are returned to
+    the pool after a render (navigated to `about:blank`) and reused by the next
+    render that asks for the same init scripts.
+
+    Long runs leak memory in the browser, so the pool recycles:
+
+    - a context after `max_renders_per_context` renders, closing its pages and
+      opening a fresh context in its place;
+    - a page whose JS heap is above `max_page_heap_bytes` after a render;
+    - a browser whose processes together use more than `max_browser_rss_bytes`
+      of resident memory, relaunching it once its renders finish.
+
+    Contexts and browsers are retired, not torn down: renders in flight finish
+    first. `stats()` returns the counters and the latest memory samples.
+    """
+
+    def __init__(
+        self,
+        browsers: int = 1,
+        contexts_per_browser: int = 2,
+        launch_options: dict | None = None,
+        max_renders_per_context: int | None = 500,
+        max_page_heap_bytes: int | None = None,
+        max_browser_rss_bytes: int | None = None,
+        memory_check_interval: int = 20,
+    ):
+        assert browsers > 0, f"browsers must be positive, got {browsers}"
+        assert contexts_per_browser > 0, (
+            f"contexts_per_browser must be positive, got {contexts_per_browser}"
+        )
+        assert memory_check_interval > 0, (
+            f"memory_check_interval must be positive, got {memory_check_interval}"
+        )
+        self.browsers = browsers
+        self.contexts_per_browser = contexts_per_browser
+        self.launch_options = launch_options or {"headless": True}
+        self.max_renders_per_context = max_renders_per_context
+        self.max_page_heap_bytes = max_page_heap_bytes
+        self.max_browser_rss_bytes = max_browser_rss_bytes
+        self.memory_check_interval = memory_check_interval
+
+        self._playwright: Playwright | None = None
+        self._browsers: list[_PooledBrowser] = []
+        self._contexts: list[_PooledContext] = []
+        self._idle: list[_PooledPage] = []
+        self._slots: asyncio.Semaphore | None = None
+        self._lifecycle_lock = asyncio.Lock()
+        self._recycle_lock = asyncio.Lock()
+        self._stats = PoolStats()
+
+    @property
+    def size(self) -> int:
+        return self.browsers * self.contexts_per_browser
+
+    @property
+    def started(self) -> bool:
+        return self._playwright is not None
+
+    async def start(self) -> "RenderPool":
+        async with self._lifecycle_lock:
+            if self.started:
+                return self
+            playwright = await async_playwright().start()
+            self._playwright = playwright
+            try:
+                for _ in range(self.browsers):
+                    browser = await self._launch()
+                    for _ in range(self.contexts_per_browser):
+                        await self._new_context(browser)
+            except Exception:
+                self._playwright = None
+                await self._close_all(playwright)
+                raise
+            self._slots = asyncio.Semaphore(self.size)
+            return self
+
+    async def stop(self) -> None:
+        async with self._lifecycle_lock:
+            if not self.started:
+                return
+            playwright = self._playwright
+            self._playwright = None
+            await self._close_all(playwright)
+
+    async def _close_all(self, playwright: Playwright) -> None:
+        for pooled in self._contexts:
+            try:
+                await pooled.context.close()
+            except Exception:
+                pass
+        for pooled in self._browsers:
+            try:
+                await pooled.browser.close()
+            except Exception:
+                pass
+        await playwright.stop()
+        self._browsers = []
+        self._contexts = []
+        self._idle = []
+        self._slots = None
+
+    async def _launch(self) -> _PooledBrowser:
+        browser = await self._playwright.chromium.launch(**self.launch_options)
+        pooled = _PooledBrowser(browser)
+        self._browsers.append(pooled)
+        return pooled
+
+    async def _new_context(self, browser: _PooledBrowser) -> _PooledContext:
+        pooled = _PooledContext(browser, await browser.browser.new_context())
+        browser.contexts += 1
+        self._contexts.append(pooled)
+        return pooled
+
+    def stats(self) -> PoolStats:
+        """Snapshot of the pool's counters (see `PoolStats`)."""
+        stats = PoolStats(**self._stats.to_dict())
+        stats.context_renders = [c.renders for c in self._contexts]
+        stats.browser_rss_bytes = [b.rss_bytes for b in self._browsers]
+        return stats
+
+    async def __aenter__(self) -> "RenderPool":
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    @asynccontextmanager
+    async def page(
+        self, viewport: dict[str, int], init_scripts: tuple[str, ...] = ()
+    ) -> AsyncIterator[Page]:
+        """
+        Borrow a page sized to `viewport`.
+
+        Pages are created with `init_scripts` installed, so only pages created
+        with the same scripts are recycled for this render.
+        """
+        if not self.started:
+            raise RuntimeError("RenderPool is not started, call `start()` first")
+        async with self._slots:
+            pooled = await self._acquire(init_scripts)
+            reusable = False
+            try:
+                await pooled.page.set_viewport_size(viewport)
+                yield pooled.page
+                reusable = True
+            finally:
+                await self._release(pooled, reusable)
+
+    async def _acquire(self, init_scripts: tuple[str, ...]) -> _PooledPage:
+        for i, pooled in enumerate(self._idle):
+            if (
+                pooled.init_scripts == init_scripts
+                and not pooled.owner.retired
+                and not pooled.page.is_closed()
+            ):
+                return self._idle.pop(i)
+
+        # No matching idle page: evict an idle page if all contexts are busy
+        # holding pages for other init scripts, then open a fresh one.
+        if self._idle and self._live_pages() >= self.size:
+            await self._close_page(self._idle.pop(0))
+        if all(c.retired for c in self._contexts):
+            # Another release is still replacing them, wait until it is done.
+            await self._recycle()
+        owner = min(
+            (c for c in self._contexts if not c.retired), key=lambda c: c.live_pages
+        )
+        page = await owner.context.new_page()
+        owner.live_pages += 1
+        self._stats.pages_opened += 1
+        for script in init_scripts:
+            await page.add_init_script(script=script)
+        return _PooledPage(page, owner, init_scripts)
+
+    async def _release(self, pooled: _PooledPage, reusable: bool) -> None:
+        owner = pooled.owner
+        owner.renders += 1
+        owner.browser.renders += 1
+        self._stats.renders += 1
+        # Sampling costs a CDP round trip, only pay it on every render when
+        # the heap decides whether the page is reused.
+        sample_heap = (
+            self.max_page_heap_bytes is not None
+            or self._stats.renders % self.memory_check_interval == 0
+        )
+        if reusable and sample_heap and not pooled.page.is_closed():
+            heap = await self._page_heap_bytes(pooled)
+            if heap is not None:
+                self._stats.peak_page_heap_bytes = max(
+                    self._stats.peak_page_heap_bytes, heap
+                )
+                if self.max_page_heap_bytes and heap > self.max_page_heap_bytes:
+                    reusable = False
+                    self._stats.pages_recycled += 1
+        if (
+            self.max_renders_per_context
+            and owner.renders >= self.max_renders_per_context
+        ):
+            owner.retired = True
+        if owner.browser.renders % self.memory_check_interval == 0:
+            await self._check_browser(owner.browser)
+
+        if reusable and not owner.retired and not pooled.page.is_closed():
+            try:
+                await pooled.page.goto("about:blank")
+                self._idle.append(pooled)
+            except Exception:
+                await self._close_page(pooled)
+        else:
+            await self._close_page(pooled)
+        await self._recycle()
+
+    async def _page_heap_bytes(self, pooled: _PooledPage) -> int | None:
+        try:
+            if pooled.cdp is None:
+                pooled.cdp = await pooled.owner.context.new_cdp_session(pooled.page)
+                await pooled.cdp.send("Performance.enable")
+            metrics = await pooled.cdp.send("Performance.getMetrics")
+        except Exception:
+            return None
+        values = {m["name"]: m["value"] for m in metrics["metrics"]}
+        heap = values.get("JSHeapUsedSize")
+        return int(heap) if heap is not None else None
+
+    async def _check_browser(self, browser: _PooledBrowser) -> None:
+        if browser.retired:
+            return
+        try:
+            if browser.cdp is None:
+                browser.cdp = await browser.browser.new_browser_cdp_session()
+            info = await browser.cdp.send("SystemInfo.getProcessInfo")
+        except Exception:
+            return
+        browser.rss_bytes = rss_bytes(p["id"] for p in info["processInfo"])
+        if browser.rss_bytes is None:
+            return
+        self._stats.peak_browser_rss_bytes = max(
+            self._stats.peak_browser_rss_bytes, browser.rss_bytes
+        )
+        if (
+            self.max_browser_rss_bytes
+            and browser.rss_bytes > self.max_browser_rss_bytes
+        ):
+            logger.info(
+                "Recycling a browser using %d MB after %d renders",
+                browser.rss_bytes // 2**20,
+                browser.renders,
+            )
+            browser.retired = True
+            for pooled in self._contexts:
+                if pooled.browser is browser:
+                    pooled.retired = True
+
+    async def _recycle(self) -> None:
+        """Replace retired contexts none of whose pages is rendering."""
+        async with self._recycle_lock:
+            for pooled in [p for p in self._idle if p.owner.retired]:
+                self._idle.remove(pooled)
+                await self._close_page(pooled)
+            for retired in [
+                c for c in self._contexts if c.retired and not c.live_pages
+            ]:
+                try:
+                    browser = retired.browser
+                    if browser.retired:
+                        if browser.replacement is None:
+                            browser.replacement = await self._launch()
+                        browser = browser.replacement
+                    await self._new_context(browser)
+                except Exception:
+                    # Keep rendering with the old context rather than shrink.
+                    logger.exception("Could not replace a retired browser context")
+                    retired.retired = False
+                    continue
+                self._contexts.remove(retired)
+                retired.browser.contexts -= 1
+                self._stats.contexts_recycled += 1
+                try:
+                    await retired.context.close()
+                except Exception:
+                    pass
+            for browser in [b for b in self._browsers if b.retired and not b.contexts]:
+                self._browsers.remove(browser)
+                self._stats.browsers_recycled += 1
+                try:
+                    await browser.browser.close()
+                except Exception:
+                    pass
+
+    async def _close_page(self, pooled: _PooledPage) -> None:
+        pooled.owner.live_pages -= 1
+        try:
+            await pooled.page.close()
+        except Exception:
+            pass
+
+    def _live_pages(self) -> int:
+        return sum(c.live_pages for c in self._contexts)
+
+
+def _megabytes(value: str | None) -> int | None:
+    return int(float(value) * 2**20) if value else None
+
+
+_default_pool: RenderPool | None = None
+_default_pool_loop: asyncio.AbstractEventLoop | None = None
+
+
+async def get_render_pool() -> RenderPool:
+    """
+    Return the process-wide render pool, starting it on first use.
+
+    Playwright objects are bound to the event loop that created them, so a new
+    pool is created when called from a different loop (e.g. a second
+    `asyncio.run`). Pool size can be tuned with `VIS2MOBILE_RENDER_BROWSERS` and
+    `VIS2MOBILE_RENDER_CONTEXTS`, recycling with `VIS2MOBILE_RENDER_MAX_RENDERS`
+    (renders per context, 0 to never recycle) and
+    `VIS2MOBILE_RENDER_MAX_RSS_MB` (resident memory per browser).
+    """
+    global _default_pool, _default_pool_loop
+    loop = asyncio.get_running_loop()
+    if _default_pool is None or _default_pool_loop is not loop:
+        _default_pool = RenderPool(
+            browsers=int(os.getenv("VIS2MOBILE_RENDER_BROWSERS", "1")),
+            contexts_per_browser=int(os.getenv("VIS2MOBILE_RENDER_CONTEXTS", "2")),
+            max_renders_per_context=int(
+                os.getenv("VIS2MOBILE_RENDER_MAX_RENDERS", "500")
+            )
+            or None,
+            max_browser_rss_bytes=_megabytes(os.getenv("VIS2MOBILE_RENDER_MAX_RSS_MB")),
+        )
+        _default_pool_loop = loop
+    return await _default_pool.start()
+
+
+async def close_render_pool() -> None:
+    """Stop the process-wide render pool, if it was started in this loop."""
+    global _default_pool, _default_pool_loop
+    pool, loop = _default_pool, _default_pool_loop
+    _default_pool, _default_pool_loop = None, None
+    if pool is not None and loop is asyncio.get_running_loop():
+        await pool.stop()
@@ -0,0 +1,255 @@
+import asyncio
+import time
+from dataclasses import asdict, dataclass, field
+
+from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# Installed before any page script runs. vega-embed's UMD bundle assigns
+# `window.vegaEmbed`; the setter wraps it so every embed promise is recorded in
+# `window.__vis2mobileEmbeds` even when the page discards it.
+VEGA_EMBED_HOOK_SCRIPT = """
+(() => {
+  if (Object.getOwnPropertyDescriptor(window, "vegaEmbed")) return;
+  const embeds = (window.__vis2mobileEmbeds = []);
+  let current;
+  Object.defineProperty(window, "vegaEmbed", {
+    configurable: true,
+    get() {
+      return current;
+    },
+    set(embed) {
+      if (typeof embed !== "function") {
+        current = embed;
+        return;
+      }
+      const hooked = function (...args) {
+        // Lets other init scripts adjust the embed options, see `render.vega`.
+        if (typeof window.__vis2mobileRewriteEmbed === "function") {
+          args = window.__vis2mobileRewriteEmbed(args);
+        }
+        const result = embed.apply(this, args);
+        embeds.push(Promise.resolve(result));
+        return result;
+      };
+      Object.assign(hooked, embed);
+      current = hooked;
+    },
+  });
+})();
+"""
+
+_WAIT_FOR_VEGA_EMBEDS = """
+async () => {
+  const results = await Promise.all(window.__vis2mobileEmbeds);
+  await Promise.all(results.map((r) => (r && r.view ? r.view.runAsync() : null)));
+  return results.length;
+}
+"""
+
+_WAIT_FOR_QUIET_FRAMES = """
+({ quietFrames, timeout }) =>
+  new Promise((resolve) => {
+    let quiet = 0;
+    let mutated = false;
+    const observer = new MutationObserver(() => {
+      mutated = true;
+    });
+    observer.observe(document, {
+      subtree: true,
+      childList: true,
+      attributes: true,
+      characterData: true,
+    });
+    const start = performance.now();
+    const tick = () => {
+      quiet = mutated ? 0 : quiet + 1;
+      mutated = false;
+      if (quiet >= quietFrames || performance.now() - start > timeout) {
+        observer.disconnect();
+        resolve(quiet >= quietFrames);
+      } else {
+        requestAnimationFrame(tick);
+      }
+    };
+    requestAnimationFrame(tick);
+  })
+"""
+
+
+class ReadinessStrategy:
+    """
+    A signal that a page has finished rendering.
+
+    Subclasses implement `wait`, which returns once the signal has fired, and
+    may override `applies` to opt out on pages without the signal (e.g. no
+    vega-embed). `init_script` is installed on the page before navigation.
+    """
+
+    name: str = "strategy"
+    init_script: str | None = None
+
+    async def applies(self, page: Page) -> bool:
+        return True
+
+    async def wait(self, page: Page, timeout_ms: float) -> None:
+        raise NotImplementedError
+
+
+class VegaEmbedStrategy(ReadinessStrategy):
+    """Resolves every `vegaEmbed(...)` promise, then `view.runAsync()` on its view."""
+
+    name = "vega-embed"
+    init_script = VEGA_EMBED_HOOK_SCRIPT
+
+    async def applies(self, page: Page) -> bool:
+        return await page.evaluate("() => (window.__vis2mobileEmbeds || []).length > 0")
+
+    async def wait(self, page: Page, timeout_ms: float) -> None:
+        await page.evaluate(_WAIT_FOR_VEGA_EMBEDS)
+
+
+class FontsReadyStrategy(ReadinessStrategy):
+    """Waits for `document.fonts.ready`, so text is not captured in a fallback font."""
+
+    name = "fonts-ready"
+
+    async def wait(self, page: Page, timeout_ms: float) -> None:
+        await page.evaluate("() => document.fonts.ready.then(() => true)")
+
+
+class AnimationFrameQuiescenceStrategy(ReadinessStrategy):
+    """Waits until the DOM has not changed for `quiet_frames` animation frames."""
+
+    name = "raf-quiescence"
+
+    def __init__(self, quiet_frames: int = 5):
+        self.quiet_frames = quiet_frames
+
+    async def wait(self, page: Page, timeout_ms: float) -> None:
+        quiet = await page.evaluate(
+            _WAIT_FOR_QUIET_FRAMES,
+            {"quietFrames": self.quiet_frames, "timeout": timeout_ms},
+        )
+        if not quiet:
+            raise asyncio.TimeoutError
+
+
+class NetworkIdleStrategy(ReadinessStrategy):
+    """Waits until there have been no network connections for 500 ms."""
+
+    name = "network-idle"
+
+    async def wait(self, page: Page, timeout_ms: float) -> None:
+        await page.wait_for_load_state("networkidle", timeout=timeout_ms)
+
+
+class SelectorStrategy(ReadinessStrategy):
+    """Waits for an element matching `selector`, e.g. the chart's `canvas, svg`."""
+
+    def __init__(self, selector: str = "canvas, svg"):
+        self.selector = selector
+        self.name = f"selector({selector})"
+
+    async def wait(self, page: Page, timeout_ms: float) -> None:
+        await page.wait_for_selector(self.selector, timeout=timeout_ms)
+
+
+@dataclass
+class ReadinessReport:
+    """
+    Outcome of waiting for a page to render.
+
+    `strategy` is the strategy whose signal fired last, i.e. the one that gated
+    readiness, or `None` if no strategy fired. `steps` has one entry per
+    strategy with its `status` (`ready`, `skipped`, `timeout` or `error`) and
+    `elapsed_ms`.
+    """
+
+    strategy: str | None
+    elapsed_ms: float
+    steps: list[dict] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ReadinessReport":
+        return cls(**data)
+
+
+class ReadinessEngine:
+    """
+    Waits for a page to be ready by running all applicable strategies at once.
+
+    The page is ready when every applicable strategy has fired, failed or run
+    past `timeout_ms`.
+    """
+
+    def __init__(
+        self,
+        strategies: list[ReadinessStrategy] | None = None,
+        timeout_ms: float = 10000,
+    ):
+        self.strategies = strategies if strategies is not None else default_strategies()
+        self.timeout_ms = timeout_ms
+
+    @property
+    def init_scripts(self) -> tuple[str, ...]:
+        return tuple(s.init_script for s in self.strategies if s.init_script)
+
+    def escalated(self, level: int) -> "ReadinessEngine":
+        """
+        A stricter engine for re-waiting on a page whose capture came out blank.
+
+        Adds network idle and a `canvas, svg` selector wait, requires a longer
+        run of quiet animation frames and doubles the timeout with each
+        `level`. No init scripts are added, so it can be used on the same page.
+        """
+        strategies = [
+            *self.strategies,
+            NetworkIdleStrategy(),
+            SelectorStrategy(),
+            AnimationFrameQuiescenceStrategy(quiet_frames=5 * 4**level),
+        ]
+        return ReadinessEngine(strategies, self.timeout_ms * 2**level)
+
+    async def wait(self, page: Page) -> ReadinessReport:
+        start = time.perf_counter()
+        steps = await asyncio.gather(
+            *(self._run(strategy, page, start) for strategy in self.strategies)
+        )
+        fired = [step for step in steps if step["status"] == "ready"]
+        last = max(fired, key=lambda step: step["elapsed_ms"], default=None)
+        return ReadinessReport(
+            strategy=last["strategy"] if last else None,
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+            steps=list(steps),
+        )
+
+    async def _run(self, strategy: ReadinessStrategy, page: Page, start: float) -> dict:
+        try:
+            if not await strategy.applies(page):
+                status = "skipped"
+            else:
+                await asyncio.wait_for(
+                    strategy.wait(page, self.timeout_ms), self.timeout_ms / 1000
+                )
+                status = "ready"
+        except (asyncio.TimeoutError, PlaywrightTimeoutError):
+            status = "timeout"
+        except Exception:
+            status = "error"
+        return {
+            "strategy": strategy.name,
+            "status": status,
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+
+
+def default_strategies() -> list[ReadinessStrategy]:
+    return [
+        VegaEmbedStrategy(),
+        FontsReadyStrategy(),
+        AnimationFrameQuiescenceStrategy(),
+    ]
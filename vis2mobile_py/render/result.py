@@ -0,0 +1,73 @@
+import io
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from vis2mobile_py.render.blank import BlankCheck
+from vis2mobile_py.render.log import RenderLog
+from vis2mobile_py.render.readiness import ReadinessReport
+
+
+@dataclass
+class RenderResult:
+    """A rendered screenshot together with what is known about how it was made."""
+
+    png: bytes
+    aspect_ratio: str
+    viewport: dict[str, int]
+    cache_hit: bool = False
+    readiness: ReadinessReport | None = None
+    blank_check: BlankCheck | None = None
+    attempts: int = 1
+    capture: str = "viewport"
+    log: RenderLog | None = None
+    # vega-embed renderer of each embed on the page, empty without Vega.
+    vega_renderers: list[str] = field(default_factory=list)
+    # Exported Vega views (see `render.vega.export_vega_data`) when requested.
+    # Cached separately from the metadata.
+    vega_data: list[dict] | None = None
+    # Texts and shapes on the page (see `render.scene.snapshot_scene`).
+    scene: dict | None = None
+    # Milliseconds per phase of this call (see `vis2mobile_py.render.events`),
+    # not stored in the cache.
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def blank(self) -> bool:
+        return self.blank_check is not None and self.blank_check.blank
+
+    def image(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.png))
+
+    def metadata(self) -> dict:
+        """JSON-serializable description of the render, without the PNG bytes."""
+        return {
+            "aspect_ratio": self.aspect_ratio,
+            "viewport": self.viewport,
+            "readiness": self.readiness.to_dict() if self.readiness else None,
+            "blank_check": self.blank_check.to_dict() if self.blank_check else None,
+            "attempts": self.attempts,
+            "capture": self.capture,
+            "log": self.log.to_dict() if self.log else None,
+            "vega_renderers": self.vega_renderers,
+        }
+
+    @classmethod
+    def from_metadata(
+        cls, png: bytes, metadata: dict, cache_hit: bool = False
+    ) -> "RenderResult":
+        readiness = metadata.get("readiness")
+        blank_check = metadata.get("blank_check")
+        log = metadata.get("log")
+        return cls(
+            png=png,
+            aspect_ratio=metadata["aspect_ratio"],
+            viewport=metadata["viewport"],
+            cache_hit=cache_hit,
+            readiness=ReadinessReport.from_dict(readiness) if readiness else None,
+            blank_check=BlankCheck.from_dict(blank_check) if blank_check else None,
+            attempts=metadata.get("attempts", 1),
+            capture=metadata.get("capture", "viewport"),
+            log=RenderLog.from_dict(log) if log else None,
+            vega_renderers=metadata.get("vega_renderers", []),
+        )
@@ -0,0 +1,206 @@
+import logging
+import mimetypes
+import os
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
+
+from playwright.async_api import Page, Route
+
+from vis2mobile_py.render.cache import referenced_local_assets
+
+logger = logging.getLogger(__name__)
+
+# Documents are served from this origin instead of `file://`, so every request
+# they make, including relative ones like `../assets/vega.min.js`, goes through
+# `page.route` and fetching local data files is not blocked by CORS.
+VIRTUAL_ORIGIN = "http://vis2mobile.local"
+
+
+def virtual_url(path: str | Path) -> str:
+    return VIRTUAL_ORIGIN + quote(Path(path).resolve().as_posix())
+
+
+class _ByteCache:
+    """LRU of file contents keyed by (path, mtime_ns, size), bounded in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, int, int], bytes] = OrderedDict()
+        self._size = 0
+
+    def read(self, path: Path) -> bytes:
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            return data
+        data = path.read_bytes()
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+        return data
+
+
+_asset_bytes = _ByteCache(max_bytes=256 * 1024 * 1024)
+
+
+@dataclass
+class RouteLog:
+    """Requests made by one render, by how they were answered."""
+
+    served: list[str] = field(default_factory=list)
+    mirrored: list[str] = field(default_factory=list)
+    fetched: list[str] = field(default_factory=list)
+    missed: list[str] = field(default_factory=list)
+    handler: Callable[[Route], Awaitable[None]] | None = field(default=None, repr=False)
+
+
+class AssetRouter:
+    """
+    Answers the requests of a rendered page from local files wherever possible.
+
+    - Local files (paths under `VIRTUAL_ORIGIN`) are served from an
+      in-process byte cache, so the Vega bundles are read from disk once.
+      Only the assets the document references and files in their directory
+      trees or in `asset_roots` are served, never hidden files there: page
+      scripts must not read e.g. `.env` or `~/.ssh`. Other paths are 404s.
+    - Remote URLs are looked up in `mirror_dir` as `<host>/<path>`, e.g.
+      `https://vega.github.io/editor/data/cars.json` maps to
+      `<mirror_dir>/vega.github.io/editor/data/cars.json`.
+    - Anything else is a miss. Misses are blocked and logged when a mirror is
+      configured. With `allow_network` they are fetched instead, and recorded
+      into the mirror so the next render is offline. Without a mirror, remote
+      requests go to the network as before.
+    """
+
+    def __init__(
+        self,
+        mirror_dir: str | Path | None = None,
+        allow_network: bool = False,
+        asset_roots: Iterable[str | Path] = (),
+    ):
+        self.mirror_dir = Path(mirror_dir).resolve() if mirror_dir else None
+        self.allow_network = allow_network or self.mirror_dir is None
+        self.asset_roots = [Path(root).resolve() for root in asset_roots]
+
+    async def install(self, page: Page, document: str | Path) -> RouteLog:
+        """Route the requests of `page`, which is about to load `document`."""
+        log = RouteLog()
+        document = Path(document).resolve()
+        assets = set(referenced_local_assets(document)) | {document}
+        # Bundles load their siblings (chunks, data next to a spec) at runtime.
+        roots = [*{asset.parent for asset in assets}, *self.asset_roots]
+
+        def allowed(local: Path) -> bool:
+            if local in assets:
+                return True
+            for root in roots:
+                if local.is_relative_to(root):
+                    relative = local.relative_to(root).parts
+                    return not any(part.startswith(".") for part in relative)
+            return False
+
+        async def handler(route: Route) -> None:
+            await self._handle(route, log, allowed)
+
+        log.handler = handler
+        await page.route("**/*", handler)
+        return log
+
+    async def uninstall(self, page: Page, log: RouteLog) -> None:
+        if not page.is_closed():
+            await page.unroute("**/*", log.handler)
+
+    async def _handle(
+        self, route: Route, log: RouteLog, allowed: Callable[[Path], bool]
+    ) -> None:
+        url = route.request.url
+        parts = urlsplit(url)
+        if url.startswith(VIRTUAL_ORIGIN + "/"):
+            local = Path(unquote(parts.path)).resolve()
+            if not allowed(local):
+                log.missed.append(url)
+                logger.warning("Refused render request outside asset roots: %s", local)
+                await route.fulfill(status=404, body="")
+            elif local.is_file():
+                log.served.append(url)
+                await self._fulfill_file(route, local)
+            else:
+                log.missed.append(url)
+                logger.warning("Render asset not found on disk: %s", local)
+                await route.fulfill(status=404, body="")
+            return
+
+        if parts.scheme not in ("http", "https"):
+            await route.continue_()
+            return
+
+        mirrored = self._mirror_path(url)
+        if mirrored is not None and mirrored.is_file():
+            log.mirrored.append(url)
+            await self._fulfill_file(route, mirrored)
+        elif self.allow_network:
+            log.fetched.append(url)
+            response = await route.fetch()
+            if mirrored is not None and response.ok:
+                mirrored.parent.mkdir(parents=True, exist_ok=True)
+                mirrored.write_bytes(await response.body())
+                logger.info("Recorded %s into the data mirror", url)
+            await route.fulfill(response=response)
+        else:
+            log.missed.append(url)
+            logger.warning("Blocked render request missing from mirror: %s", url)
+            await route.abort("blockedbyclient")
+
+    def _mirror_path(self, url: str) -> Path | None:
+        if self.mirror_dir is None:
+            return None
+        parts = urlsplit(url)
+        relative = unquote(parts.path).lstrip("/")
+        if not relative or relative.endswith("/"):
+            relative += "index.html"
+        candidate = (self.mirror_dir / parts.netloc / relative).resolve()
+        if not candidate.is_relative_to(self.mirror_dir):
+            return None
+        return candidate
+
+    async def _fulfill_file(self, route: Route, path: Path) -> None:
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        await route.fulfill(
+            status=200,
+            body=_asset_bytes.read(path),
+            content_type=content_type,
+            headers={"Access-Control-Allow-Origin": "*"},
+        )
+
+
+_default_router: AssetRouter | None = None
+
+
+def get_asset_router() -> AssetRouter:
+    """
+    Process-wide router configured from the environment.
+
+    `VIS2MOBILE_DATA_MIRROR` points at the mirror directory and
+    `VIS2MOBILE_ALLOW_NETWORK=1` lets mirror misses through (and records them).
+    `VIS2MOBILE_ASSET_ROOTS` lists further directories (separated by
+    `os.pathsep`) whose files pages may load.
+    """
+    global _default_router
+    if _default_router is None:
+        _default_router = AssetRouter(
+            mirror_dir=os.getenv("VIS2MOBILE_DATA_MIRROR") or None,
+            allow_network=os.getenv("VIS2MOBILE_ALLOW_NETWORK", "0") == "1",
+            asset_roots=[
+                root
+                for root in os.getenv("VIS2MOBILE_ASSET_ROOTS", "").split(os.pathsep)
+                if root
+            ],
+        )
+    return _default_router
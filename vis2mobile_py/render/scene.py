@@ -0,0 +1,248 @@
+import json
+
+from playwright.async_api import Page
+
+# Everything is measured in page coordinates (CSS pixels) as [x, y, w, h].
+# Vega views are read from their scenegraph, which covers canvas renders, and
+# their containers are skipped by the DOM walk so nothing is listed twice.
+_SCENE_SNAPSHOT = """
+async ({ maxTexts, maxShapeGroups, maxLabels }) => {
+  const round = (v) => Math.round(v);
+  const color = (c) => {
+    if (typeof c !== "string") return null;
+    const m = /^rgba?\\((\\d+),\\s*(\\d+),\\s*(\\d+)(?:,\\s*([\\d.]+))?\\)$/.exec(c);
+    if (!m) return c === "none" ? null : c;
+    if (m[4] !== undefined && Number(m[4]) === 0) return null;
+    return "#" + [m[1], m[2], m[3]].map((v) => Number(v).toString(16).padStart(2, "0")).join("");
+  };
+  const pageBox = (rect) => [
+    round(rect.left + window.scrollX),
+    round(rect.top + window.scrollY),
+    round(rect.width),
+    round(rect.height),
+  ];
+  const union = (a, b) => {
+    if (!a) return b;
+    if (!b) return a;
+    const x = Math.min(a[0], b[0]);
+    const y = Math.min(a[1], b[1]);
+    return [x, y, Math.max(a[0] + a[2], b[0] + b[2]) - x, Math.max(a[1] + a[3], b[1] + b[3]) - y];
+  };
+
+  const texts = [];
+  const axes = [];
+  const legends = [];
+  const shapes = new Map();
+  const addShape = (type, fill, stroke, box) => {
+    const key = `${type}|${fill}|${stroke}`;
+    const group = shapes.get(key) || { type, fill, stroke, count: 0, box: null };
+    group.count += 1;
+    group.box = union(group.box, box);
+    shapes.set(key, group);
+  };
+  const addText = (text, box, size, weight, fill) => {
+    text = text.replace(/\\s+/g, " ").trim();
+    if (text) texts.push({ text, box, size, weight, color: color(fill) });
+  };
+
+  // Vega views, through the scenegraph.
+  const results = await Promise.all(window.__vis2mobileEmbeds || []);
+  const views = results.map((r) => r && r.view).filter(Boolean);
+  const containers = views.map((view) => view.container()).filter(Boolean);
+  for (const view of views) {
+    const rect = view.container().getBoundingClientRect();
+    const [ox, oy] = view.origin();
+    const walk = (mark, dx, dy, guide) => {
+      for (const item of mark.items || []) {
+        const b = item.bounds;
+        const box =
+          b && Number.isFinite(b.x1)
+            ? [round(b.x1 + dx), round(b.y1 + dy), round(b.x2 - b.x1), round(b.y2 - b.y1)]
+            : null;
+        if (mark.marktype === "group") {
+          let collector = guide;
+          if (!guide && (mark.role === "axis" || mark.role === "legend")) {
+            collector = { box, title: null, labels: [] };
+            (mark.role === "axis" ? axes : legends).push(collector);
+          }
+          for (const child of item.items || []) {
+            walk(child, dx + (item.x || 0), dy + (item.y || 0), collector);
+          }
+        } else if (mark.marktype === "text") {
+          const text = Array.isArray(item.text) ? item.text.join(" ") : String(item.text ?? "");
+          const role = mark.role || "";
+          if (guide && role.endsWith("-title")) guide.title = text;
+          else if (guide) guide.labels.push(text);
+          else addText(text, box, item.fontSize || null, item.fontWeight ?? null, item.fill);
+        } else if (!guide && item.opacity !== 0) {
+          addShape(mark.marktype, color(item.fill), color(item.stroke), box);
+        }
+      }
+    };
+    walk(view.scenegraph().root, rect.left + window.scrollX + ox, rect.top + window.scrollY + oy, null);
+  }
+
+  // Everything else, through the DOM.
+  const GUIDE = /(^|[\\s_-])(axis|legend)([\\s_-]|$)/i;
+  const SHAPES = new Set(["rect", "circle", "ellipse", "line", "polyline", "polygon", "path"]);
+  const visible = (el) =>
+    el.checkVisibility({ opacityProperty: true, visibilityProperty: true });
+  const root = document.body || document.documentElement;
+  const walker = document.createTreeWalker(
+    root,
+    NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT,
+    (node) => {
+      if (node.nodeType === Node.TEXT_NODE) return NodeFilter.FILTER_ACCEPT;
+      if (["SCRIPT", "STYLE", "NOSCRIPT", "TEMPLATE"].includes(node.tagName)) {
+        return NodeFilter.FILTER_REJECT;
+      }
+      if (containers.includes(node) || !visible(node)) return NodeFilter.FILTER_REJECT;
+      return NodeFilter.FILTER_ACCEPT;
+    },
+  );
+  for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+    if (node.nodeType === Node.TEXT_NODE) {
+      const parent = node.parentElement;
+      if (!parent || !node.textContent.trim()) continue;
+      const range = document.createRange();
+      range.selectNodeContents(node);
+      const style = getComputedStyle(parent);
+      const isSvg = parent instanceof SVGElement;
+      addText(
+        node.textContent,
+        pageBox(range.getBoundingClientRect()),
+        parseFloat(style.fontSize) || null,
+        style.fontWeight,
+        isSvg ? style.fill : style.color,
+      );
+      continue;
+    }
+    const tag = node.tagName.toLowerCase();
+    const className = typeof node.className === "string" ? node.className : node.getAttribute("class") || "";
+    if (GUIDE.test(className) || /role-(axis|legend)/.test(className)) {
+      // Axes and legends are summarized by their labels, not listed in full.
+      const collector = { box: pageBox(node.getBoundingClientRect()), title: null, labels: [] };
+      const title = node.querySelector("[class*=title]");
+      if (title) collector.title = title.textContent.trim();
+      const labels = node.querySelectorAll("text, tspan, span, div, li");
+      for (const label of labels) {
+        const text = label.children.length === 0 ? label.textContent.trim() : "";
+        if (text && text !== collector.title) collector.labels.push(text);
+      }
+      (/legend/i.test(className) ? legends : axes).push(collector);
+      // Skip the subtree: continue from the last node inside it.
+      let last = node;
+      while (last.lastChild) last = last.lastChild;
+      walker.currentNode = last;
+      continue;
+    }
+    if (node instanceof SVGElement && SHAPES.has(tag)) {
+      const style = getComputedStyle(node);
+      addShape(tag, color(style.fill), color(style.stroke), pageBox(node.getBoundingClientRect()));
+    } else if (tag === "canvas" || tag === "img") {
+      addShape(tag, null, null, pageBox(node.getBoundingClientRect()));
+    }
+  }
+
+  for (const guide of [...axes, ...legends]) {
+    guide.label_count = guide.labels.length;
+    guide.labels = guide.labels.slice(0, maxLabels);
+  }
+  return JSON.stringify({
+    page: {
+      width: document.documentElement.scrollWidth,
+      height: document.documentElement.scrollHeight,
+      title: document.title || null,
+    },
+    texts: texts.slice(0, maxTexts),
+    text_count: texts.length,
+    shapes: [...shapes.values()].sort((a, b) => b.count - a.count).slice(0, maxShapeGroups),
+    shape_group_count: shapes.size,
+    axes,
+    legends,
+  });
+}
+"""
+
+
+async def snapshot_scene(
+    page: Page, max_texts: int = 400, max_shape_groups: int = 60, max_labels: int = 40
+) -> dict:
+    """
+    Compact description of what a rendered `page` shows: visible texts with
+    their boxes, font sizes, weights and colors; an inventory of shapes grouped
+    by type, fill and stroke; and axes and legends with their titles and
+    labels. Vega charts are read from their scenegraph, so canvas renders are
+    described as well.
+
+    Lists are capped (`text_count`, `shape_group_count` and `label_count` keep
+    the full sizes), so the result stays small however large the source is.
+    """
+    return json.loads(
+        await page.evaluate(
+            _SCENE_SNAPSHOT,
+            {
+                "maxTexts": max_texts,
+                "maxShapeGroups": max_shape_groups,
+                "maxLabels": max_labels,
+            },
+        )
+    )
+
+
+def _box(box: list[int] | None) -> str:
+    return "[" + ",".join(str(v) for v in box) + "]" if box else "[?]"
+
+
+def describe_scene(scene: dict, max_chars: int = 12000) -> str:
+    """Render a `snapshot_scene` result as text of at most `max_chars` characters."""
+    page = scene["page"]
+    lines = [f"Page: {page['width']}x{page['height']} px"]
+    if page.get("title"):
+        lines[0] += f', title "{page["title"]}"'
+    lines.append("All boxes are [x,y,width,height] in CSS pixels.")
+
+    for kind, guides in (("Axes", scene["axes"]), ("Legends", scene["legends"])):
+        if not guides:
+            continue
+        lines.append(f"{kind}:")
+        for guide in guides:
+            title = f' title "{guide["title"]}"' if guide.get("title") else ""
+            labels = ", ".join(guide["labels"])
+            more = guide["label_count"] - len(guide["labels"])
+            if more > 0:
+                labels += f", ... ({more} more)"
+            lines.append(f"- {_box(guide['box'])}{title}: {labels}")
+
+    if scene["shapes"]:
+        lines.append("Shapes (type, fill, stroke, count, union box):")
+        for shape in scene["shapes"]:
+            lines.append(
+                f"- {shape['type']} fill={shape['fill'] or 'none'} "
+                f"stroke={shape['stroke'] or 'none'} x{shape['count']} {_box(shape['box'])}"
+            )
+        more = scene["shape_group_count"] - len(scene["shapes"])
+        if more > 0:
+            lines.append(f"- ... ({more} more shape groups)")
+
+    if scene["texts"]:
+        lines.append("Texts (box, font size, weight, color):")
+        for text in scene["texts"]:
+            size = f"{text['size']:g}px" if text.get("size") else "?"
+            lines.append(
+                f'- "{text["text"]}" {_box(text["box"])} {size} '
+                f"{text.get('weight') or ''} {text.get('color') or ''}".rstrip()
+            )
+        more = scene["text_count"] - len(scene["texts"])
+        if more > 0:
+            lines.append(f"- ... ({more} more texts)")
+
+    described = []
+    length = 0
+    for i, line in enumerate(lines):
+        if length + len(line) + 1 > max_chars:
+            described.append(f"... ({len(lines) - i} more lines omitted)")
+            break
+        described.append(line)
+        length += len(line) + 1
+    return "\n".join(described)
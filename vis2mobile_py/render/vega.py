@@ -0,0 +1,220 @@
+import json
+import re
+from pathlib import Path
+from typing import Literal
+
+from playwright.async_api import Page
+
+VegaRenderer = Literal["auto", "svg", "canvas"]
+
+# Installed before the page's scripts, next to `VEGA_EMBED_HOOK_SCRIPT`, which
+# passes the arguments of every `vegaEmbed(...)` call through
+# `window.__vis2mobileRewriteEmbed`. The renderer each embed ends up with is
+# recorded in `window.__vis2mobileRenderers`.
+_EMBED_RENDERER_SCRIPT = """
+((config) => {
+  const renderers = (window.__vis2mobileRenderers = []);
+
+  // Inline data rows (vega-lite `data.values`/`datasets`, vega `data[].values`)
+  // times the number of data-driven marks: an upper bound on the mark count.
+  // Data the spec does not carry inline (a `url`, a generator, a vega-lite
+  // dataset bound by name at runtime) can be any size: the estimate is then
+  // Infinity.
+  const estimateMarks = (spec) => {
+    const datasets = spec.datasets && typeof spec.datasets === "object" ? spec.datasets : {};
+    const isVega = Array.isArray(spec.data) || String(spec.$schema).includes("/schema/vega/v");
+    let rows = 0;
+    let units = 0;
+    let unknown = false;
+    const visitData = (data) => {
+      const values = typeof data.name === "string" && data.name in datasets
+        ? datasets[data.name]
+        : data.values;
+      if (Array.isArray(values)) {
+        rows += values.length;
+      } else if (typeof values === "string") {
+        rows += values.split("\\n").length;
+      } else if (values !== undefined || "url" in data || "sequence" in data) {
+        unknown = true;
+      } else if (!isVega && "name" in data) {
+        // Named vega datasets without values derive from another (`source`)
+        // or are filled by signals, e.g. selection stores.
+        unknown = true;
+      }
+    };
+    const walk = (node, key) => {
+      if (Array.isArray(node)) {
+        node.forEach((child) => walk(child, key));
+        return;
+      }
+      if (!node || typeof node !== "object") return;
+      if (key === "data") visitData(node);
+      for (const [k, v] of Object.entries(node)) {
+        if (k === "datasets" || (k === "values" && key === "data")) continue;
+        if (k === "mark" || (k === "from" && v && v.data)) units += 1;
+        walk(v, k);
+      }
+    };
+    walk(spec);
+    return unknown ? Infinity : rows * Math.max(units, 1);
+  };
+
+  window.__vis2mobileRewriteEmbed = ([el, spec, opts, ...rest]) => {
+    opts = Object.assign({}, opts);
+    if (config.renderer !== "auto") {
+      opts.renderer = config.renderer;
+    } else if (!opts.renderer && spec && typeof spec === "object") {
+      opts.renderer = estimateMarks(spec) >= config.canvasThreshold ? "canvas" : "svg";
+    }
+    // vega-embed renders to canvas unless told otherwise.
+    renderers.push(opts.renderer || "canvas");
+    return [el, spec, opts, ...rest];
+  };
+})(%s);
+"""
+
+RENDERERS_USED = "() => window.__vis2mobileRenderers || []"
+
+
+def embed_renderer_script(renderer: VegaRenderer, canvas_threshold: int) -> str:
+    """
+    Init script choosing the vega-embed renderer of every embed on the page.
+
+    `svg` and `canvas` force that renderer. `auto` keeps a renderer the page
+    asked for, and otherwise uses SVG, which keeps marks and text in the DOM,
+    only when all of the spec's data is inline and its estimated mark count
+    stays below `canvas_threshold`. Specs loading data from a URL, and heavier
+    ones, use canvas, since building thousands of SVG nodes dominates the
+    render.
+    """
+    config = {"renderer": renderer, "canvasThreshold": canvas_threshold}
+    return _EMBED_RENDERER_SCRIPT % json.dumps(config)
+
+
+# Serialized in the page so that Dates become ISO strings and Vega's symbol
+# keys are dropped, exactly as `JSON.stringify` would.
+_EXPORT_VEGA_DATA = """
+async ({ maxRows, maxItems }) => {
+  const round = (v) => Math.round(v * 10) / 10;
+  const box = (b, dx, dy) =>
+    b && Number.isFinite(b.x1)
+      ? [round(b.x1 + dx), round(b.y1 + dy), round(b.x2 + dx), round(b.y2 + dy)]
+      : null;
+  // Bounds of every mark and of its items, in view coordinates: Vega keeps
+  // them relative to the enclosing group, so group offsets are accumulated.
+  const walkMarks = (mark, dx, dy, out) => {
+    const items = mark.items || [];
+    const entry = {
+      name: mark.name || null,
+      marktype: mark.marktype,
+      role: mark.role || null,
+      count: items.length,
+      bounds: box(mark.bounds, dx, dy),
+    };
+    if (mark.marktype !== "group") {
+      entry.items = items.slice(0, maxItems).map((item) => box(item.bounds, dx, dy));
+    }
+    out.push(entry);
+    if (mark.marktype === "group") {
+      for (const item of items) {
+        for (const child of item.items || []) {
+          walkMarks(child, dx + (item.x || 0), dy + (item.y || 0), out);
+        }
+      }
+    }
+    return out;
+  };
+
+  const results = await Promise.all(window.__vis2mobileEmbeds || []);
+  const views = [];
+  for (const result of results) {
+    const view = result && result.view;
+    if (!view) continue;
+    const datasets = {};
+    for (const name of Object.keys(view._runtime.data)) {
+      let rows;
+      try {
+        rows = view.data(name);
+      } catch (e) {
+        continue;
+      }
+      if (!Array.isArray(rows)) continue;
+      datasets[name] = { count: rows.length, rows: rows.slice(0, maxRows) };
+    }
+    const container = view.container();
+    const rect = container ? container.getBoundingClientRect() : null;
+    let state = null;
+    try {
+      state = view.getState();
+    } catch (e) {
+      // Some signal values (e.g. DOM events) cannot be captured.
+    }
+    views.push({
+      state,
+      datasets,
+      origin: view.origin(),
+      container: rect && [
+        round(rect.left + window.scrollX),
+        round(rect.top + window.scrollY),
+        round(rect.width),
+        round(rect.height),
+      ],
+      scenegraph: walkMarks(view.scenegraph().root, 0, 0, []),
+    });
+  }
+  return JSON.stringify(views);
+}
+"""
+
+
+async def export_vega_data(
+    page: Page, max_rows: int = 10000, max_items: int = 5000
+) -> list[dict]:
+    """
+    Pull the state, every named dataset after transforms and the scenegraph
+    mark bounds out of each Vega view on a rendered `page`.
+
+    Returns one entry per view. Datasets keep at most `max_rows` rows (their
+    full length is in `count`) and marks the bounds of at most `max_items`
+    items. Scenegraph bounds are in view coordinates; add `origin` and the
+    page position of `container` for page coordinates.
+    """
+    return json.loads(
+        await page.evaluate(
+            _EXPORT_VEGA_DATA, {"maxRows": max_rows, "maxItems": max_items}
+        )
+    )
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+def save_vega_data(views: list[dict], directory: str | Path) -> list[Path]:
+    """
+    Write exported views as compact JSON into `directory`:
+    `state.json`, `scenegraph.json` and `datasets/<name>.json` per view, in
+    `view-<i>/` subdirectories when the page has more than one view.
+    """
+    directory = Path(directory)
+    written = []
+
+    def write(path: Path, data) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, separators=(",", ":")))
+        written.append(path)
+
+    for i, view in enumerate(views):
+        target = directory if len(views) == 1 else directory / f"view-{i}"
+        write(target / "state.json", view["state"])
+        write(
+            target / "scenegraph.json",
+            {
+                "origin": view["origin"],
+                "container": view["container"],
+                "marks": view["scenegraph"],
+            },
+        )
+        for name, dataset in view["datasets"].items():
+            write(target / "datasets" / f"{_safe_name(name)}.json", dataset)
+    return written
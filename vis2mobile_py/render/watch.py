@@ -0,0 +1,238 @@
+"""
+Re-render original visualizations into their projects whenever they change.
+
+    python -m vis2mobile_py render --watch \
+        vega-examples/vega/02.html=vega-mobile-projects/vega-02
+
+watches each source and the local assets it references (see
+`referenced_local_assets`) and, a short debounce after an edit, re-renders the
+projects it affects into their `original_visualization/` folder, exactly as
+`prepare_project*.py` does, without generating a new plan. The render pool
+stays warm between edits. Files are watched with inotify where available and
+polled otherwise.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import shutil
+import struct
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from vis2mobile_py.render.cache import referenced_local_assets
+from vis2mobile_py.render.log import save_render_log
+from vis2mobile_py.render.vega import save_vega_data
+from vis2mobile_py.utils import html_to_images
+
+# Rendered profiles and the files they are written to in `original_visualization/`.
+PROFILES = {"desktop": "desktop.png", "mobile": "desktop_on_mobile.png"}
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+# Editors either rewrite a file in place or write a new file and rename it
+# over the old one, so directories are watched rather than files.
+_IN_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+@dataclass
+class WatchTarget:
+    """A source visualization and the project it is rendered into."""
+
+    source: Path
+    project: Path
+
+    @property
+    def original_folder(self) -> Path:
+        return self.project / "original_visualization"
+
+    def files(self) -> set[Path]:
+        """The source and every local asset it references."""
+        source = self.source.resolve()
+        if not source.exists():
+            return {source}
+        return {source, *referenced_local_assets(source)}
+
+
+class _InotifyWatcher:
+    """Reports changes to a set of files through Linux inotify."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: dict[int, Path] = {}
+        self._files: set[Path] = set()
+        self._pending: set[Path] = set()
+        self._changed = asyncio.Event()
+        asyncio.get_running_loop().add_reader(self._fd, self._read)
+
+    def watch(self, files: set[Path]) -> None:
+        self._files = files
+        watched = set(self._dirs.values())
+        for directory in {f.parent for f in files} - watched:
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), _IN_MASK
+            )
+            if wd >= 0:
+                self._dirs[wd] = directory
+        for wd, directory in list(self._dirs.items()):
+            if directory not in {f.parent for f in files}:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._dirs[wd]
+
+    def _read(self) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # Events were dropped, assume everything changed.
+                self._pending |= self._files
+            elif wd in self._dirs:
+                path = self._dirs[wd] / os.fsdecode(name)
+                if path in self._files:
+                    self._pending.add(path)
+        if self._pending:
+            self._changed.set()
+
+    async def wait(self) -> set[Path]:
+        await self._changed.wait()
+        self._changed.clear()
+        changed, self._pending = self._pending, set()
+        return changed
+
+    def close(self) -> None:
+        asyncio.get_running_loop().remove_reader(self._fd)
+        os.close(self._fd)
+
+
+class _PollingWatcher:
+    """Reports changes to a set of files by comparing their `stat` regularly."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self._stats: dict[Path, tuple[int, int] | None] = {}
+
+    @staticmethod
+    def _stat(path: Path) -> tuple[int, int] | None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def watch(self, files: set[Path]) -> None:
+        self._stats = {f: self._stats.get(f, self._stat(f)) for f in files}
+
+    async def wait(self) -> set[Path]:
+        while True:
+            await asyncio.sleep(self.interval)
+            current = {f: self._stat(f) for f in self._stats}
+            changed = {f for f, stat in current.items() if stat != self._stats[f]}
+            self._stats = current
+            if changed:
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+def _make_watcher(poll: bool) -> _InotifyWatcher | _PollingWatcher:
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return _InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return _PollingWatcher()
+
+
+async def render_target(target: WatchTarget) -> str:
+    """Render `target` into its project like `prepare_project*.py` does."""
+    folder = target.original_folder
+    folder.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    renders = await html_to_images(
+        target.source,
+        list(PROFILES),
+        return_type="result",
+        save_to={ratio: folder / name for ratio, name in PROFILES.items()},
+        on_blank="flag",
+        vega_data=True,
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    shutil.copy2(target.source, folder / f"desktop{target.source.suffix}")
+    errors = save_render_log(
+        {ratio: result.log for ratio, result in renders.items()},
+        folder / "render-log.json",
+    )
+    if renders["desktop"].vega_data:
+        save_vega_data(renders["desktop"].vega_data, folder / "vega-data")
+
+    status = f"{target.project.name}: {elapsed:.0f} ms"
+    cached = [r for r, result in renders.items() if result.cache_hit]
+    if cached:
+        status += f" (cached: {', '.join(cached)})"
+    blank = [r for r, result in renders.items() if result.blank]
+    if blank:
+        status += f", blank in {', '.join(blank)}"
+    if errors:
+        status += "\n  " + errors.replace("\n", "\n  ")
+    return status
+
+
+async def render_targets(targets: list[WatchTarget]) -> None:
+    """Render `targets` concurrently, printing one status line per target."""
+    outcomes = await asyncio.gather(
+        *(render_target(t) for t in targets), return_exceptions=True
+    )
+    for target, outcome in zip(targets, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"✗ {target.project.name}: {outcome}", flush=True)
+        else:
+            print(f"✓ {outcome}", flush=True)
+
+
+async def watch(
+    targets: list[WatchTarget], debounce: float = 0.1, poll: bool = False
+) -> None:
+    """
+    Render every target once, then re-render the targets whose source or
+    assets changed, `debounce` seconds after the last change of a burst
+    (saving a file often takes several writes). Runs until cancelled.
+    """
+    await render_targets(targets)
+    watcher = _make_watcher(poll)
+    print(
+        f"Watching {len(targets)} sources with {type(watcher).__name__[1:]}, "
+        "press Ctrl+C to stop",
+        flush=True,
+    )
+    try:
+        while True:
+            files = {t.project: t.files() for t in targets}
+            watcher.watch(set().union(*files.values()))
+            changed = await watcher.wait()
+            while True:
+                try:
+                    changed |= await asyncio.wait_for(watcher.wait(), debounce)
+                except TimeoutError:
+                    break
+            affected = [t for t in targets if files[t.project] & changed]
+            if affected:
+                await render_targets(affected)
+    finally:
+        watcher.close()
@@ -1,63 +1,487 @@
 from pathlib import Path
 from PIL import Image
+from playwright.async_api import Page
 from typing import Literal
+from collections.abc import AsyncIterator, Iterable
+from dataclasses import dataclass, field
 
-from playwright.async_api import async_playwright
-import io
+import asyncio
 import base64
-from async_lru import alru_cache
+import json
+import logging
+import time
 
+from vis2mobile_py.render.blank import BlankRenderError, check_blank
+from vis2mobile_py.render.cache import get_render_cache, render_cache_key
+from vis2mobile_py.render.capture import take_screenshot
+from vis2mobile_py.render.daemon import get_render_socket, render_via_daemon
+from vis2mobile_py.render.events import (
+    PhaseTimer,
+    RenderEvent,
+    chromium_rss_bytes,
+    emit,
+    has_render_hooks,
+)
+from vis2mobile_py.render.log import RenderLogRecorder
+from vis2mobile_py.render.options import RenderOptions
+from vis2mobile_py.render.pool import RenderPool, get_render_pool
+from vis2mobile_py.render.readiness import ReadinessEngine
+from vis2mobile_py.render.result import RenderResult
+from vis2mobile_py.render.routes import AssetRouter, get_asset_router, virtual_url
+from vis2mobile_py.render.scene import snapshot_scene
+from vis2mobile_py.render.vega import RENDERERS_USED, export_vega_data
 
-@alru_cache(maxsize=32)
-async def __get_image_bytes(
-    path: str | Path, aspect_ratio: Literal["desktop", "mobile", "iphonex", "pixelxl"]
-) -> bytes:
-    viewports = {
-        "desktop": {"width": 1920, "height": 1080},
-        "mobile": {"width": 375, "height": 812},
-        "iphonex": {"width": 375, "height": 812},
-        "pixelxl": {"width": 411, "height": 731},
-    }
+logger = logging.getLogger(__name__)
 
-    viewport = viewports[aspect_ratio]
+# Data pulled out of the rendered page into the `RenderResult` field of the
+# same name, cached as a `<name>.json` artifact next to the screenshot.
+PAGE_EXPORTS = {"vega_data": export_vega_data, "scene": snapshot_scene}
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page(viewport=viewport)
+VIEWPORTS = {
+    "desktop": {"width": 1920, "height": 1080},
+    "mobile": {"width": 375, "height": 812},
+    "iphonex": {"width": 375, "height": 812},
+    "pixelxl": {"width": 411, "height": 731},
+}
 
-        # Convert path to absolute file URI
-        file_url = Path(path).resolve().as_uri()
-        await page.goto(file_url)
 
-        # Wait for Vega/Vega-Lite chart to render (they create canvas or svg elements)
-        # This handles dynamically rendered visualizations
-        try:
-            await page.wait_for_selector("canvas, svg", timeout=10000)
-            # Additional small delay to ensure rendering is complete
-            await page.wait_for_timeout(500)
-        except Exception:
-            # If no canvas/svg found, wait a bit anyway for any JS to execute
-            await page.wait_for_timeout(1000)
+AspectRatio = Literal["desktop", "mobile", "iphonex", "pixelxl"]
+ReturnType = Literal["image", "bytes_png", "base64_png", "result", "path"]
 
-        # Take screenshot
-        screenshot_bytes = await page.screenshot(type="png")
-        await browser.close()
-    return screenshot_bytes
 
+async def __capture(
+    page: Page,
+    aspect_ratio: AspectRatio,
+    readiness: ReadinessEngine,
+    max_attempts: int,
+    options: RenderOptions,
+    timer: PhaseTimer,
+) -> RenderResult:
+    with timer.phase("wait"):
+        report = await readiness.wait(page)
+    with timer.phase("screenshot"):
+        png, capture = await take_screenshot(page, options)
+    with timer.phase("decode"):
+        blank_check = check_blank(png)
+    attempts = 1
+    # Blank captures are usually charts still waiting on data or layout, so
+    # keep waiting on the same page with stricter strategies before giving up.
+    while blank_check.blank and attempts < max_attempts:
+        with timer.phase("wait"):
+            report = await readiness.escalated(attempts).wait(page)
+        with timer.phase("screenshot"):
+            png, capture = await take_screenshot(page, options)
+        with timer.phase("decode"):
+            blank_check = check_blank(png)
+        attempts += 1
+    return RenderResult(
+        png=png,
+        aspect_ratio=aspect_ratio,
+        viewport=VIEWPORTS[aspect_ratio],
+        readiness=report,
+        blank_check=blank_check,
+        attempts=attempts,
+        capture=capture,
+        vega_renderers=await page.evaluate(RENDERERS_USED),
+    )
 
-async def html_to_image(
+
+def __emit(
     path: str | Path,
-    aspect_ratio: Literal["desktop", "mobile", "iphonex", "pixelxl"],
-    return_type: Literal["image", "bytes_png", "base64_png"] = "image",
-) -> Image.Image | bytes | str:
-    assert aspect_ratio in ["desktop", "mobile", "iphonex", "pixelxl"], (
-        f"Invalid aspect ratio: {aspect_ratio}"
+    result: RenderResult,
+    timer: PhaseTimer,
+    chromium_rss: int | None = None,
+) -> None:
+    result.timings = timer.phases
+    if not has_render_hooks():
+        return
+    emit(
+        RenderEvent(
+            path=str(path),
+            aspect_ratio=result.aspect_ratio,
+            cache_hit=result.cache_hit,
+            phases=timer.phases,
+            output_bytes=len(result.png),
+            strategy=result.readiness.strategy if result.readiness else None,
+            attempts=result.attempts,
+            blank=result.blank,
+            chromium_rss_bytes=chromium_rss,
+        )
     )
-    screenshot_bytes = await __get_image_bytes(path, aspect_ratio)
 
-    if return_type == "image":
-        return Image.open(io.BytesIO(screenshot_bytes))
+
+async def __render(
+    path: str | Path,
+    aspect_ratios: tuple[AspectRatio, ...],
+    pool: RenderPool | None = None,
+    readiness: ReadinessEngine | None = None,
+    on_blank: Literal["raise", "flag"] = "raise",
+    max_attempts: int = 3,
+    router: AssetRouter | None = None,
+    options: RenderOptions | None = None,
+    exports: tuple[str, ...] = (),
+) -> dict[AspectRatio, RenderResult]:
+    if options is None:
+        options = RenderOptions()
+    # Exports are taken once per page load, in the viewport of the first ratio,
+    # and stored with its render.
+    export_ratio = aspect_ratios[0] if exports else None
+    cache = get_render_cache()
+    results: dict[AspectRatio, RenderResult] = {}
+    cache_keys: dict[AspectRatio, str] = {}
+    timers = {aspect_ratio: PhaseTimer() for aspect_ratio in aspect_ratios}
+    if cache is not None:
+        for aspect_ratio in aspect_ratios:
+            with timers[aspect_ratio].phase("cache_lookup"):
+                cache_keys[aspect_ratio] = render_cache_key(
+                    path, VIEWPORTS[aspect_ratio], **options.cache_key_options()
+                )
+                cached = cache.get(cache_keys[aspect_ratio])
+                metadata = cache.get_metadata(cache_keys[aspect_ratio])
+                exported = {}
+                if aspect_ratio == export_ratio:
+                    exported = {
+                        name: cache.get_artifact(
+                            cache_keys[aspect_ratio], f"{name}.json"
+                        )
+                        for name in exports
+                    }
+            if (
+                cached is not None
+                and metadata is not None
+                and None not in exported.values()
+            ):
+                results[aspect_ratio] = RenderResult.from_metadata(
+                    cached, metadata, cache_hit=True
+                )
+                for name, data in exported.items():
+                    setattr(results[aspect_ratio], name, json.loads(data))
+                __emit(path, results[aspect_ratio], timers[aspect_ratio])
+
+    missing = [r for r in aspect_ratios if r not in results]
+    if not missing:
+        return results
+
+    acquire_start = time.perf_counter()
+    pool = await pool.start() if pool is not None else await get_render_pool()
+    if readiness is None:
+        readiness = ReadinessEngine()
+    if router is None:
+        router = get_asset_router()
+
+    # Load the document once in the first missing viewport, then resize the
+    # page for every other profile instead of reloading it.
+    init_scripts = readiness.init_scripts + options.init_scripts
+    async with pool.page(VIEWPORTS[missing[0]], init_scripts) as page:
+        first = timers[missing[0]]
+        first.add("acquire", (time.perf_counter() - acquire_start) * 1000)
+        # Pooled pages keep their emulated media, so set it on every render.
+        await page.emulate_media(
+            reduced_motion="reduce" if options.deterministic else "no-preference"
+        )
+        route_log = await router.install(page, path)
+        recorder = RenderLogRecorder(page)
+        render_log = recorder.attach()
+        try:
+            with first.phase("goto"):
+                await page.goto(virtual_url(path))
+
+            for i, aspect_ratio in enumerate(missing):
+                timer = timers[aspect_ratio]
+                if i > 0:
+                    # Responsive charts (e.g. Vega with `width: "container"`)
+                    # re-lay out on `resize`, which the readiness engine waits for.
+                    with timer.phase("resize"):
+                        await page.set_viewport_size(VIEWPORTS[aspect_ratio])
+                result = await __capture(
+                    page, aspect_ratio, readiness, max_attempts, options, timer
+                )
+                # Errors seen so far, including those of the initial load.
+                result.log = render_log.snapshot()
+                if aspect_ratio == export_ratio:
+                    for name in exports:
+                        with timer.phase(name):
+                            setattr(result, name, await PAGE_EXPORTS[name](page))
+                chromium_rss = chromium_rss_bytes() if has_render_hooks() else None
+                if result.blank:
+                    __emit(path, result, timer, chromium_rss)
+                    if on_blank == "raise":
+                        raise BlankRenderError(
+                            str(path), aspect_ratio, result.blank_check
+                        )
+                    # Never cache blank renders, the next call should try again.
+                else:
+                    # Nor renders that hit errors: the key does not cover
+                    # remote data or the mirror, whose fix should take effect.
+                    if cache is not None and not result.log.has_errors:
+                        with timer.phase("cache_write"):
+                            if aspect_ratio == export_ratio:
+                                for name in exports:
+                                    cache.put_artifact(
+                                        cache_keys[aspect_ratio],
+                                        f"{name}.json",
+                                        json.dumps(getattr(result, name)).encode(),
+                                    )
+                            cache.put(
+                                cache_keys[aspect_ratio], result.png, result.metadata()
+                            )
+                    __emit(path, result, timer, chromium_rss)
+                results[aspect_ratio] = result
+        finally:
+            recorder.detach()
+            await router.uninstall(page, route_log)
+    return results
+
+
+def __convert(
+    result: RenderResult, return_type: ReturnType, save_to: str | Path | None = None
+) -> Image.Image | bytes | str | RenderResult | Path:
+    if save_to is not None:
+        # The PNG bytes from Playwright (or the cache) are written as they are,
+        # without decoding and re-encoding them through PIL.
+        save_to = Path(save_to)
+        save_to.write_bytes(result.png)
+    if return_type == "path":
+        assert save_to is not None, 'return_type="path" requires save_to'
+        return save_to
+    elif return_type == "image":
+        return result.image()
     elif return_type == "bytes_png":
-        return screenshot_bytes
+        return result.png
     elif return_type == "base64_png":
-        return base64.b64encode(screenshot_bytes).decode("utf-8")
+        return base64.b64encode(result.png).decode("utf-8")
+    elif return_type == "result":
+        return result
+
+
+async def html_to_images(
+    path: str | Path,
+    ratios: list[AspectRatio],
+    return_type: ReturnType = "image",
+    pool: RenderPool | None = None,
+    readiness: ReadinessEngine | None = None,
+    *,
+    on_blank: Literal["raise", "flag"] = "raise",
+    max_attempts: int = 3,
+    router: AssetRouter | None = None,
+    save_to: dict[AspectRatio, str | Path] | None = None,
+    options: RenderOptions | None = None,
+    vega_data: bool = False,
+    scene: bool = False,
+) -> dict[AspectRatio, Image.Image | bytes | str | RenderResult | Path]:
+    """
+    Render an HTML/SVG file in several aspect ratios from a single page load.
+
+    The document is loaded and its charts laid out once; the viewport is then
+    resized for each remaining ratio and the page captured after it re-lays out.
+    Returns a dict mapping each ratio to its screenshot as `return_type`.
+    `save_to` maps ratios to PNG files that the screenshots are written to
+    as-is, which together with `return_type="path"` never decodes them.
+    With `vega_data`, the Vega views of the page are exported into
+    `RenderResult.vega_data` of the first ratio (see `export_vega_data`), and
+    with `scene` its texts and shapes into `RenderResult.scene` (see
+    `snapshot_scene`).
+    """
+    for aspect_ratio in ratios:
+        assert aspect_ratio in VIEWPORTS, f"Invalid aspect ratio: {aspect_ratio}"
+    assert on_blank in ["raise", "flag"], f"Invalid on_blank: {on_blank}"
+    aspect_ratios = tuple(dict.fromkeys(ratios))
+    exports = tuple(
+        name for name, wanted in (("vega_data", vega_data), ("scene", scene)) if wanted
+    )
+    results = None
+    socket_path = get_render_socket()
+    # Custom pools, readiness engines and routers only exist in this process.
+    if socket_path and pool is None and readiness is None and router is None:
+        try:
+            results = await render_via_daemon(
+                socket_path,
+                path,
+                aspect_ratios,
+                on_blank,
+                max_attempts,
+                options,
+                exports,
+            )
+        except (ConnectionError, FileNotFoundError) as e:
+            logger.warning(
+                "Render daemon at %s is unavailable (%s), rendering locally",
+                socket_path,
+                e,
+            )
+    if results is None:
+        results = await __render(
+            path,
+            aspect_ratios,
+            pool,
+            readiness,
+            on_blank,
+            max_attempts,
+            router,
+            options,
+            exports,
+        )
+    save_to = save_to or {}
+    return {r: __convert(results[r], return_type, save_to.get(r)) for r in ratios}
+
+
+async def html_to_image(
+    path: str | Path,
+    aspect_ratio: AspectRatio,
+    return_type: ReturnType = "image",
+    pool: RenderPool | None = None,
+    readiness: ReadinessEngine | None = None,
+    *,
+    on_blank: Literal["raise", "flag"] = "raise",
+    max_attempts: int = 3,
+    router: AssetRouter | None = None,
+    save_to: str | Path | None = None,
+    options: RenderOptions | None = None,
+    vega_data: bool = False,
+    scene: bool = False,
+) -> Image.Image | bytes | str | RenderResult | Path:
+    """
+    Render an HTML/SVG file to a screenshot in the given aspect ratio.
+
+    Renders go through `pool` if given, otherwise through the process-wide
+    render pool, so Chromium is launched once and kept warm across calls. Call
+    `vis2mobile_py.render.pool.close_render_pool()` before the event loop exits.
+
+    Screenshots are cached on disk by the content of the document and its local
+    assets (see `vis2mobile_py.render.cache`), so unchanged inputs are served
+    without touching Chromium, across processes.
+
+    Instead of fixed sleeps, the page is captured once `readiness` (by default
+    vega-embed/`view.runAsync()`, `document.fonts.ready` and animation-frame
+    quiescence) reports it ready. Use `return_type="result"` to get a
+    `RenderResult` that records which strategy fired and how long it took.
+
+    Near-blank captures are re-waited with escalating strategies up to
+    `max_attempts` times in total. If still blank, `BlankRenderError` is raised,
+    or with `on_blank="flag"` the capture is returned with `RenderResult.blank`
+    set. Blank captures are never cached.
+
+    Every request of the page goes through `router` (by default
+    `get_asset_router()`): local assets are served from an in-process byte
+    cache and remote data from the `VIS2MOBILE_DATA_MIRROR` mirror.
+
+    With `save_to`, the PNG is written to that file without re-encoding; use
+    `return_type="path"` to skip decoding it as well.
+
+    `options` (see `RenderOptions`) selects what is captured: the viewport,
+    the element matching a selector such as `#vis`, the content bounding box or
+    the full scrollable page up to a maximum height. It also sets the renderer
+    of Vega charts (`RenderResult.vega_renderers` records the one used).
+
+    With `vega_data`, the state, transformed datasets and scenegraph bounds of
+    every Vega view are exported into `RenderResult.vega_data`. With `scene`,
+    `RenderResult.scene` describes the visible texts, shapes, axes and legends
+    of the page, a compact stand-in for its source (see `describe_scene`).
+
+    Console errors, uncaught page errors and failed requests seen during the
+    render are returned in `RenderResult.log`; a chart that failed to render
+    still produces an image, so check `log.has_errors` before relying on it.
+
+    With `VIS2MOBILE_RENDER_SOCKET` set, renders that use the default pool,
+    readiness engine and router are sent to the render daemon listening there
+    (see `vis2mobile_py.render.daemon`), falling back to a local render if it
+    is not running.
+
+    Every render reports per-phase timings in `RenderResult.timings` and emits
+    a `RenderEvent` to the hooks in `vis2mobile_py.render.events`.
+    """
+    images = await html_to_images(
+        path,
+        [aspect_ratio],
+        return_type,
+        pool,
+        readiness,
+        on_blank=on_blank,
+        max_attempts=max_attempts,
+        router=router,
+        save_to={aspect_ratio: save_to} if save_to is not None else None,
+        options=options,
+        vega_data=vega_data,
+        scene=scene,
+    )
+    return images[aspect_ratio]
+
+
+@dataclass
+class RenderJob:
+    path: str | Path
+    ratios: list[AspectRatio] = field(default_factory=lambda: ["desktop", "mobile"])
+    # Names of `PAGE_EXPORTS` to take from the page, e.g. `("vega_data",)`.
+    exports: tuple[str, ...] = ()
+
+
+@dataclass
+class RenderJobResult:
+    """Outcome of one `RenderJob`: either `results` per ratio or the `error`."""
+
+    job: RenderJob
+    results: dict[AspectRatio, RenderResult] | None = None
+    error: Exception | None = None
+
+
+async def render_many(
+    jobs: Iterable[RenderJob],
+    concurrency: int = 4,
+    pool: RenderPool | None = None,
+    readiness: ReadinessEngine | None = None,
+    *,
+    on_blank: Literal["raise", "flag"] = "raise",
+    max_attempts: int = 3,
+    router: AssetRouter | None = None,
+    options: RenderOptions | None = None,
+) -> AsyncIterator[RenderJobResult]:
+    """
+    Render many files in one process, yielding each job as soon as it finishes.
+
+    Up to `concurrency` jobs render at once, each on its own page of a single
+    shared browser (a dedicated pool with `concurrency` contexts, unless `pool`
+    is given). A failing job is yielded with its `error` and does not stop the
+    others. Cached renders never start the browser.
+    """
+    assert concurrency > 0, f"concurrency must be positive, got {concurrency}"
+    owned_pool = pool is None
+    if owned_pool:
+        pool = RenderPool(browsers=1, contexts_per_browser=concurrency)
+    pending = iter(jobs)
+    finished: asyncio.Queue[RenderJobResult | None] = asyncio.Queue()
+
+    async def worker() -> None:
+        # Workers share one iterator, so every job is taken exactly once.
+        for job in pending:
+            try:
+                results = await __render(
+                    job.path,
+                    tuple(dict.fromkeys(job.ratios)),
+                    pool,
+                    readiness,
+                    on_blank,
+                    max_attempts,
+                    router,
+                    options,
+                    tuple(job.exports),
+                )
+                await finished.put(RenderJobResult(job, results=results))
+            except Exception as e:
+                await finished.put(RenderJobResult(job, error=e))
+        await finished.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        running = len(workers)
+        while running > 0:
+            item = await finished.get()
+            if item is None:
+                running -= 1
+            else:
+                yield item
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if owned_pool:
+            await pool.stop()